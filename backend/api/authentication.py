@@ -0,0 +1,103 @@
+import copy
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram import metrics
+
+
+def token_digest(key):
+    """Ключ токена в памяти не хранится, только его хэш."""
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def user_version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def user_version(user_id):
+    """
+    Версия учётных данных пользователя в кэше Django. Сброс виден
+    всем процессам, только если кэш общий (memcached в docker-compose).
+    С LocMemCache по умолчанию другие процессы узнают об отключении
+    пользователя или удалении токена не раньше AUTH_TOKEN_CACHE_TTL.
+    """
+    key = user_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    cache.set(user_version_key(user_id), uuid.uuid4().hex, timeout=None)
+
+
+class TokenCache:
+    """LRU-кэш проверенных токенов с ограниченным временем жизни."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[-1] < time.monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[:-1]
+
+    def set(self, digest, *values):
+        with self._lock:
+            self._entries[digest] = (*values, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Проверка токена с кэшем в памяти процесса вместо запроса
+    Token + User на каждый вызов API. Запись живёт не дольше
+    AUTH_TOKEN_CACHE_TTL, даже если версия пользователя не сброшена.
+    """
+
+    def authenticate_credentials(self, key):
+        digest = token_digest(key)
+        entry = token_cache.get(digest)
+        if entry is not None:
+            user, token, cached_version = entry
+            if cached_version == user_version(user.pk):
+                metrics.cache_result('auth_token', True)
+                # Пользователь общий для всех запросов, отдаём копию.
+                # Его счётчики могут быть старше TTL, но save() их не
+                # пишет (users.models.CountersMixin).
+                return copy.copy(user), token
+        metrics.cache_result('auth_token', False)
+        user, token = super().authenticate_credentials(key)
+        # Сброс версии между запросом к базе и этим чтением может
+        # оставить запись устаревшей, но не дольше TTL.
+        token_cache.set(digest, user, token, user_version(user.pk))
+        return copy.copy(user), token
@@ -0,0 +1,62 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+
+class Rollback(Exception):
+    """Откатывает транзакцию с тестовыми данными бенчмарка."""
+
+
+@contextmanager
+def rolled_back():
+    """Все изменения внутри блока откатываются после замеров."""
+    try:
+        with transaction.atomic():
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def measure(func, repeat):
+    """Время выполнения func в миллисекундах для каждого запуска."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def count_queries(func):
+    """
+    Число запросов к базе за вызов func. Считает через execute_wrapper:
+    журнал connection.queries очищается в начале каждого запроса.
+    """
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        func()
+    return len(queries)
+
+
+def percentile(samples, share):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def format_stats(name, samples):
+    return (
+        f'{name:<40} '
+        f'p50={percentile(samples, 0.5):8.2f} ms  '
+        f'p95={percentile(samples, 0.95):8.2f} ms  '
+        f'p99={percentile(samples, 0.99):8.2f} ms  '
+        f'mean={statistics.mean(samples):8.2f} ms'
+    )
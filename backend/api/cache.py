@@ -0,0 +1,141 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from django.utils.http import (http_date, parse_etags,
+                               parse_http_date_safe)
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes import catalog
+from recipes.models import Recipe
+from users.models import Follow
+
+# Поля ответа, которые зависят от пользователя и в кэш не попадают.
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+LIGHT_FIELDS = ('pk', 'author', 'pub_date', 'updated')
+
+
+def digest(*parts):
+    return hashlib.md5(
+        '|'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def body_versions(request):
+    """
+    Общая для всех рецептов ответа часть ключа: версии справочников
+    тегов и ингредиентов и адрес сайта, от которого строятся ссылки
+    на картинки. Версии читаются из кэша, поэтому один раз на ответ.
+    """
+    return (
+        catalog.tags.version,
+        catalog.ingredients.version,
+        request.scheme,
+        request.get_host(),
+    )
+
+
+def body_key(recipe, versions):
+    """
+    Ключ общей для всех пользователей части ответа. Меняется вместе
+    с рецептом и с body_versions.
+    """
+    return 'recipe-body:{}:{}'.format(recipe.pk, digest(
+        recipe.updated.timestamp(), *versions
+    ))
+
+
+class RecipeBodies:
+    """
+    Ответы для рецептов в два слоя: тело рецепта берётся из кэша
+    по версии, признаки пользователя накладываются поверх.
+    """
+
+    def __init__(self, serializer_class, context):
+        self.serializer_class = serializer_class
+        self.context = context
+        self.request = context['request']
+
+    def load_bodies(self, recipes):
+        versions = body_versions(self.request)
+        keys = {recipe.pk: body_key(recipe, versions) for recipe in recipes}
+        bodies = cache.get_many(keys.values())
+        missing = [pk for pk, key in keys.items() if key not in bodies]
+        if missing:
+            # Тело строится от имени анонима, признаки потом заменяются.
+            fresh = Recipe.objects.for_read(AnonymousUser()).in_bulk(missing)
+            serialized = {
+                keys[pk]: self.serializer_class(
+                    recipe, context=self.context
+                ).data
+                for pk, recipe in fresh.items()
+            }
+            cache.set_many(serialized, settings.RECIPE_CACHE_TIMEOUT)
+            bodies.update(serialized)
+        return keys, bodies
+
+    def subscribed_authors(self, recipes):
+        user = self.request.user
+        if not user.is_authenticated:
+            return set()
+        return set(Follow.objects.filter(
+            user=user, author_id__in={recipe.author_id for recipe in recipes}
+        ).values_list('author_id', flat=True))
+
+    def represent(self, recipes):
+        """
+        Данные ответа по рецептам из облегчённого queryset с полями
+        LIGHT_FIELDS и признаками with_user_flags. Возвращает данные
+        и ETag, учитывающий версии тел и признаки пользователя.
+        """
+        keys, bodies = self.load_bodies(recipes)
+        subscribed = self.subscribed_authors(recipes)
+        data, parts = [], []
+        for recipe in recipes:
+            body = bodies.get(keys[recipe.pk])
+            if body is None:
+                continue
+            item = dict(body)
+            for field in USER_FIELDS:
+                item[field] = getattr(recipe, field)
+            item['author'] = dict(
+                body['author'],
+                is_subscribed=recipe.author_id in subscribed,
+            )
+            data.append(item)
+            parts.extend((
+                keys[recipe.pk], item['is_favorited'],
+                item['is_in_shopping_cart'], item['author']['is_subscribed'],
+            ))
+        return data, f'"{digest(*parts)}"'
+
+
+def conditional(request, response, etag, last_modified=None):
+    """
+    Заменяет ответ на 304, если у клиента актуальная версия.
+    Last-Modified учитывается только для анонимов: у пользователя
+    признаки могут поменяться без изменения рецепта.
+    """
+    if request.user.is_authenticated:
+        last_modified = None
+    if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+    if if_none_match:
+        not_modified = etag in if_none_match or '*' in if_none_match
+    else:
+        since = parse_http_date_safe(
+            request.headers.get('If-Modified-Since', '')
+        )
+        not_modified = (
+            last_modified is not None and since is not None
+            and int(last_modified.timestamp()) <= since
+        )
+    if not_modified:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Authorization',))
+    return response
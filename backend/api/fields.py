@@ -1,14 +1,100 @@
 import base64
+import binascii
 
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import ImageFile
 
-from rest_framework.serializers import (ImageField)
+from foodgram import metrics
+
+from rest_framework.serializers import (Field, ImageField,
+                                        PrimaryKeyRelatedField)
+
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
 class Base64ImageField(ImageField):
+    default_error_messages = {
+        'too_large': (
+            'Размер изображения не должен превышать {max_bytes} байт.'
+        ),
+        'too_big': (
+            'Стороны изображения не должны превышать {max_side} пикселей.'
+        ),
+    }
+
+    def decode(self, imgstr):
+        """
+        Декодирует base64 по частям. Размеры картинки проверяются,
+        как только разобран её заголовок, до декодирования остатка.
+        """
+        max_bytes = settings.RECIPE_IMAGE_MAX_BYTES
+        max_side = settings.RECIPE_IMAGE_MAX_SIDE
+        if len(imgstr) * 3 // 4 > max_bytes:
+            self.fail('too_large', max_bytes=max_bytes)
+        parser = ImageFile.Parser()
+        chunks = []
+        for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+            try:
+                chunk = base64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK_SIZE]
+                )
+            except (binascii.Error, ValueError):
+                self.fail('invalid_image')
+            chunks.append(chunk)
+            if parser.image is None:
+                try:
+                    parser.feed(chunk)
+                except OSError:
+                    self.fail('invalid_image')
+                if parser.image is not None and (
+                    max(parser.image.size) > max_side
+                ):
+                    self.fail('too_big', max_side=max_side)
+        content = b''.join(chunks)
+        metrics.IMAGE_UPLOAD_BYTES.observe(len(content))
+        return content
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = ContentFile(self.decode(imgstr), name='temp.' + ext)
         return super().to_internal_value(data)
+
+
+class BulkPrimaryKeyRelatedField(PrimaryKeyRelatedField):
+    """
+    Поле первичного ключа без поиска объекта.
+    Объекты по всем ключам сразу находит сериализатор.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class ThumbnailsField(Field):
+    """Ссылки на превью фотографии по размерам и форматам."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'thumbnails')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for size_name, names in value.items():
+            urls[size_name] = {}
+            for extension, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[size_name][extension] = url
+        return urls
@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Collate, Upper
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 from recipes.models import Recipe, Tag
+from recipes.search import search as search_recipes
 
 
 class RecipeFilter(FilterSet):
@@ -15,6 +20,11 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='is_in_shopping_cart_filter'
     )
+    search = filters.CharFilter(method='search_filter')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'popular'), ('trending', 'trending')),
+        method='ordering_filter',
+    )
 
     class Meta:
         model = Recipe
@@ -23,6 +33,8 @@ class RecipeFilter(FilterSet):
             'author',
             'is_favorited',
             'is_in_shopping_cart',
+            'search',
+            'ordering',
         )
 
     def is_favorited_filter(self, queryset, name, data):
@@ -37,8 +49,78 @@ class RecipeFilter(FilterSet):
             return queryset.filter(shopping_recipes__user=user)
         return queryset
 
+    def search_filter(self, queryset, name, data):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search_recipes(queryset, data)
+
+    def ordering_filter(self, queryset, name, data):
+        """
+        Сортировка по рейтингу из таблицы RecipeScore. Рейтинг есть
+        у каждого рецепта (create_score), поэтому соединение внутреннее,
+        а порядок совпадает с индексом (-рейтинг, -recipe_id).
+        """
+        return queryset.filter(score__isnull=False).order_by(
+            f'-score__{data}', '-score__recipe_id'
+        )
 
-class IngredientFilter(SearchFilter):
-    """Класс для фильтрации обьектов Tags."""
+
+class IngredientFilter(BaseFilterBackend):
+    """
+    Автодополнение ингредиентов. Сначала идут совпадения по началу
+    названия, затем по подстроке; limit ограничивает выдачу.
+    """
 
     search_param = 'name'
+    limit_param = 'limit'
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_param])
+        except (KeyError, ValueError):
+            return None
+        return min(max(limit, 1), settings.INGREDIENTS_LIMIT)
+
+    def prefix_matches(self, queryset, name):
+        """
+        Совпадения по началу названия. На PostgreSQL условие и порядок
+        строятся по UPPER(name) COLLATE "C", как индекс из миграции 0014,
+        и первые строки читаются из индекса без сортировки.
+        """
+        if connection.vendor != 'postgresql':
+            return queryset.filter(name__istartswith=name).order_by(
+                Upper('name')
+            )
+        return queryset.annotate(
+            name_key=Collate(Upper('name'), 'C')
+        ).filter(name_key__startswith=name.upper()).order_by('name_key')
+
+    def autocomplete(self, queryset, name, limit):
+        """
+        Сначала совпадения по началу названия по индексу. Подстрока,
+        для коротких запросов без индекса (pg_trgm не работает
+        с 1-2 символами), ищется, только если их меньше limit.
+        """
+        ingredients = list(self.prefix_matches(queryset, name)[:limit])
+        if len(ingredients) < limit:
+            ingredients += queryset.filter(name__icontains=name).exclude(
+                name__istartswith=name
+            ).order_by('name')[:limit - len(ingredients)]
+        return ingredients
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, '').strip()
+        limit = self.get_limit(request)
+        is_list = getattr(view, 'action', None) == 'list'
+        if name and limit and is_list:
+            return self.autocomplete(queryset, name, limit)
+        if name:
+            queryset = queryset.filter(name__icontains=name).annotate(
+                match_rank=Case(
+                    When(name__istartswith=name, then=Value(0)),
+                    default=Value(1),
+                    output_field=IntegerField(),
+                )
+            ).order_by('match_rank', 'name')
+        if limit and is_list:
+            queryset = queryset[:limit]
+        return queryset
@@ -0,0 +1,113 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import count_queries, format_stats, measure, rolled_back
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет основные эндпоинты API через тестовый клиент Django: '
+        'перцентили задержки и число запросов к базе. Работает на '
+        'текущей базе или на данных generate_fake_data (--generate), '
+        'все изменения откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--generate', action='store_true',
+            help='Сначала создать синтетические данные.',
+        )
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--user', help='Email пользователя, от имени которого идут '
+            'запросы; по умолчанию самый активный.',
+        )
+
+    def get_user(self, email):
+        if email:
+            user = User.objects.filter(email=email).first()
+        else:
+            user = User.objects.annotate(
+                activity=Count('follower', distinct=True)
+                + Count('shopping_user', distinct=True)
+            ).order_by('-activity').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, запустите с --generate'
+            )
+        return user
+
+    def cases(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        tag = Tag.objects.first()
+        cases = [
+            ('recipes, page 1', '/api/recipes/', {'limit': 6}),
+            ('recipes, page 50', '/api/recipes/', {'limit': 6, 'page': 50}),
+            ('recipes, cursor', '/api/recipes/', {'limit': 6, 'cursor': ''}),
+            ('recipes, is_favorited', '/api/recipes/',
+             {'limit': 6, 'is_favorited': 1}),
+            ('recipes, ordering=popular', '/api/recipes/',
+             {'limit': 6, 'ordering': 'popular'}),
+            ('recipes, feed', '/api/recipes/feed/', {'limit': 6}),
+            ('subscriptions', '/api/users/subscriptions/',
+             {'limit': 6, 'recipes_limit': 3}),
+            ('download_shopping_cart',
+             '/api/recipes/download_shopping_cart/', {}),
+            ('ingredients, name=со', '/api/ingredients/',
+             {'name': 'со', 'limit': 20}),
+        ]
+        if tag is not None:
+            cases.insert(3, (
+                f'recipes, tags={tag.slug}', '/api/recipes/',
+                {'limit': 6, 'tags': tag.slug},
+            ))
+        if recipe is not None:
+            cases.insert(1, (
+                'recipe detail', f'/api/recipes/{recipe.pk}/', {},
+            ))
+        return cases
+
+    def run_cases(self, options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token.key}'
+        )
+        self.stdout.write(f'Пользователь: {user.email}')
+        for name, path, params in self.cases(user):
+            def request():
+                response = client.get(path, params)
+                if response.status_code != 200:
+                    raise CommandError(
+                        f'{name}: ответ {response.status_code}'
+                    )
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                return response
+
+            measure(request, options['warmup'])
+            queries = count_queries(request)
+            self.stdout.write(
+                format_stats(name, measure(request, options['repeat']))
+                + f'  queries={queries}'
+            )
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            if options['generate']:
+                call_command(
+                    'generate_fake_data',
+                    users=options['users'],
+                    recipes=options['recipes'],
+                    prefix='bench',
+                    stdout=self.stdout,
+                )
+            self.run_cases(options)
@@ -0,0 +1,75 @@
+import csv
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import format_stats, measure, rolled_back
+from api.serializers import IngredientSerializer
+from api.views import IngredientsViewSet
+from recipes.models import Ingredient
+
+DEFAULT_QUERIES = ('а', 'мо', 'сыр', 'кури', 'томат', 'соль')
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет автодополнение ингредиентов на копиях ingredients.csv. '
+        'Данные создаются в транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file', default='recipes/data/ingredients.csv',
+        )
+        parser.add_argument('--scale', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('queries', nargs='*', default=DEFAULT_QUERIES)
+
+    def load(self, file_name, scale):
+        with open(file_name, encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        # Номер есть у каждой копии, включая первую: исходные названия
+        # уже могут быть в базе, а пара (название, единица) уникальна.
+        for copy in range(scale):
+            Ingredient.objects.bulk_create(
+                [
+                    Ingredient(
+                        name=f'{name} {copy}',
+                        measurement_unit=measurement_unit,
+                    )
+                    for name, measurement_unit in rows
+                ],
+                batch_size=5000,
+            )
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = IngredientsViewSet.as_view({'get': 'list'})
+        with rolled_back():
+            self.load(options['file'], options['scale'])
+            self.stdout.write(
+                f'Ингредиентов: {Ingredient.objects.count()}'
+            )
+            for query in options['queries']:
+                def full_prefix_list():
+                    return IngredientSerializer(
+                        Ingredient.objects.filter(name__istartswith=query),
+                        many=True,
+                    ).data
+
+                def autocomplete():
+                    request = factory.get(
+                        '/api/ingredients/',
+                        {'name': query, 'limit': options['limit']},
+                    )
+                    return view(request).render()
+
+                self.stdout.write(format_stats(
+                    f'{query!r} prefix, whole list',
+                    measure(full_prefix_list, options['repeat']),
+                ))
+                self.stdout.write(format_stats(
+                    f'{query!r} autocomplete, limit={options["limit"]}',
+                    measure(autocomplete, options['repeat']),
+                ))
@@ -0,0 +1,134 @@
+import random
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import format_stats, measure, rolled_back
+from api.views import RecipeViewSet
+from recipes.models import Ingredient, IngredientInRecipesAmount, Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет подбор рецептов по имеющимся ингредиентам '
+        'на синтетических данных. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--per-recipe', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            'pantry_sizes', nargs='*', type=int, default=(3, 10, 30),
+        )
+
+    def load(self, options, rng):
+        author = User.objects.create_user(
+            email='bench-match@example.com',
+            username='bench-match',
+            password='bench-match',
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+                for number in range(options['ingredients'])
+            ],
+            batch_size=1000,
+        )
+        ingredient_ids = [ingredient.pk for ingredient in ingredients]
+        if None in ingredient_ids:
+            ingredient_ids = list(Ingredient.objects.filter(
+                name__startswith='Ингредиент '
+            ).values_list('pk', flat=True))
+        per_recipe = options['per_recipe']
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipes/bench.png',
+                    ingredients_count=per_recipe,
+                )
+                for number in range(options['recipes'])
+            ],
+            batch_size=1000,
+        )
+        # Популярные ингредиенты встречаются в рецептах чаще остальных.
+        weights = [1 / (rank + 1) for rank in range(len(ingredient_ids))]
+        rows = []
+        for recipe_id in Recipe.objects.filter(
+            author=author
+        ).values_list('pk', flat=True):
+            chosen = set()
+            while len(chosen) < per_recipe:
+                chosen.update(rng.choices(ingredient_ids, weights, k=1))
+            rows.extend(
+                IngredientInRecipesAmount(
+                    recipe_id=recipe_id, ingredient_id=ingredient_id,
+                    amount=1,
+                )
+                for ingredient_id in chosen
+            )
+        IngredientInRecipesAmount.objects.bulk_create(rows, batch_size=5000)
+        return ingredient_ids, weights
+
+    def naive_match(self, pantry, limit):
+        """Подбор перебором всей таблицы ингредиентов рецептов."""
+        totals, matched = Counter(), Counter()
+        for recipe_id, ingredient_id in (
+            IngredientInRecipesAmount.objects.values_list(
+                'recipe_id', 'ingredient_id'
+            ).iterator()
+        ):
+            totals[recipe_id] += 1
+            if ingredient_id in pantry:
+                matched[recipe_id] += 1
+        return sorted(
+            matched, key=lambda pk: -matched[pk] / totals[pk]
+        )[:limit]
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        factory = APIRequestFactory()
+        view = RecipeViewSet.as_view(
+            {'post': 'match'}, **RecipeViewSet.match.kwargs
+        )
+        with rolled_back():
+            ingredient_ids, weights = self.load(options, rng)
+            self.stdout.write(
+                f'Рецептов: {Recipe.objects.count()}, строк ингредиентов: '
+                f'{IngredientInRecipesAmount.objects.count()}'
+            )
+            for size in options['pantry_sizes']:
+                pantry = set()
+                while len(pantry) < size:
+                    pantry.update(rng.choices(ingredient_ids, weights, k=1))
+
+                def endpoint():
+                    request = factory.post(
+                        '/api/recipes/match/',
+                        {'ingredients': list(pantry)},
+                        format='json',
+                        SERVER_NAME='localhost',
+                    )
+                    response = view(request).render()
+                    assert response.status_code == 200, response.content
+                    return response
+
+                self.stdout.write(format_stats(
+                    f'{size} ingredients, /match/',
+                    measure(endpoint, options['repeat']),
+                ))
+                self.stdout.write(format_stats(
+                    f'{size} ingredients, full scan',
+                    measure(
+                        lambda: self.naive_match(pantry, 6),
+                        max(1, options['repeat'] // 5),
+                    ),
+                ))
@@ -0,0 +1,95 @@
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import format_stats, measure, rolled_back
+from api.pagination import RecipeCursorPaginator
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает номерную и курсорную пагинацию ленты рецептов '
+        'на первой и глубокой странице. Данные откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--page', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def load(self, count):
+        author = User.objects.create_user(
+            email='bench-pagination@example.com',
+            username='bench-pagination',
+            password='bench-pagination',
+        )
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author=author,
+                    name=f'Рецепт {number}',
+                    text='Описание',
+                    cooking_time=10,
+                    image='recipes/bench.png',
+                )
+                for number in range(count)
+            ],
+            batch_size=1000,
+        )
+        # auto_now_add перезаписывает pub_date при вставке.
+        start = timezone.now()
+        Recipe.objects.bulk_update(
+            [
+                Recipe(pk=pk, pub_date=start - timedelta(minutes=number))
+                for number, pk in enumerate(
+                    Recipe.objects.filter(author=author).order_by('pk')
+                    .values_list('pk', flat=True)
+                )
+            ],
+            ['pub_date'],
+            batch_size=1000,
+        )
+
+    def deep_cursor(self, factory, offset):
+        """Курсор, указывающий на ту же глубину, что и страница page."""
+        recipe = Recipe.objects.order_by('-pub_date', '-id')[offset - 1]
+        paginator = RecipeCursorPaginator()
+        paginator.base_url = 'http://localhost/api/recipes/'
+        url = paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=str(recipe.pub_date))
+        )
+        return parse_qs(urlparse(url).query)['cursor'][0]
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        view = RecipeViewSet.as_view({'get': 'list'})
+        limit, page = options['limit'], options['page']
+
+        def get(params):
+            request = factory.get(
+                '/api/recipes/', params, SERVER_NAME='localhost'
+            )
+            return lambda: view(request).render()
+
+        with rolled_back():
+            self.load(options['recipes'])
+            cursor = self.deep_cursor(factory, (page - 1) * limit)
+            cases = (
+                ('offset, page 1', {'page': 1, 'limit': limit}),
+                (f'offset, page {page}', {'page': page, 'limit': limit}),
+                ('cursor, page 1', {'cursor': '', 'limit': limit}),
+                (f'cursor, depth of page {page}',
+                 {'cursor': cursor, 'limit': limit}),
+            )
+            for name, params in cases:
+                self.stdout.write(format_stats(
+                    name, measure(get(params), options['repeat'])
+                ))
@@ -0,0 +1,141 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import format_stats
+from recipes.models import Recipe
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест горячих чтений: поднимает gunicorn в режимах '
+        'WSGI и ASGI на текущей базе и сравнивает пропускную способность '
+        'и задержки при параллельных запросах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', choices=MODES, default=list(MODES)
+        )
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность замера каждого режима, в секундах.',
+        )
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument('--port', type=int, default=8765)
+
+    def paths(self):
+        recipe = Recipe.objects.order_by('-pk').first()
+        if recipe is None:
+            raise CommandError(
+                'Нет рецептов, сначала запустите generate_fake_data'
+            )
+        return [
+            '/api/recipes/?' + urlencode({'limit': 6}),
+            f'/api/recipes/{recipe.pk}/',
+            '/api/tags/',
+            '/api/ingredients/?' + urlencode({'name': 'со', 'limit': 20}),
+        ]
+
+    def start_server(self, mode, options):
+        env = {**os.environ, 'SERVER_MODE': mode}
+        env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '--config', 'gunicorn.conf.py',
+                '--bind', f'127.0.0.1:{options["port"]}',
+                '--workers', str(options['workers']),
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{mode}: gunicorn не запустился')
+            try:
+                socket.create_connection(
+                    ('127.0.0.1', options['port']), timeout=1
+                ).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'{mode}: gunicorn не ответил за 30 секунд')
+
+    def load(self, port, paths, concurrency, duration):
+        """
+        Каждый клиент по кругу запрашивает пути через своё keep-alive
+        соединение. Возвращает задержки в миллисекундах и число ошибок.
+        """
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            samples, errors = [], 0
+            index = offset
+            while time.monotonic() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    connection.request(
+                        'GET', path, headers={'Host': 'localhost'}
+                    )
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    continue
+                samples.append((time.perf_counter() - start) * 1000)
+                if response.status != 200:
+                    errors += 1
+            connection.close()
+            return samples, errors
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(client, range(concurrency)))
+        samples = [sample for result, _ in results for sample in result]
+        return samples, sum(errors for _, errors in results)
+
+    def handle(self, *args, **options):
+        paths = self.paths()
+        self.stdout.write(
+            f'Воркеров: {options["workers"]}, '
+            f'клиентов: {options["concurrency"]}'
+        )
+        for mode in options['modes']:
+            server = self.start_server(mode, options)
+            try:
+                self.load(options['port'], paths, options['concurrency'],
+                          options['warmup'])
+                samples, errors = self.load(
+                    options['port'], paths, options['concurrency'],
+                    options['duration'],
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            if not samples:
+                raise CommandError(f'{mode}: ни одного ответа')
+            self.stdout.write(
+                format_stats(mode, samples)
+                + f'  rps={len(samples) / options["duration"]:8.1f}'
+                + f'  errors={errors}'
+            )
@@ -0,0 +1,114 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.db import connection, connections
+
+from foodgram import metrics
+
+from .profiling import RequestProfile, current_profile, view_stats
+
+logger = logging.getLogger('api.profiling')
+
+
+class RequestProfilingMiddleware:
+    """
+    Число запросов к базе, время в базе и в сериализаторах для каждого
+    запроса. Отдаёт их в заголовке Server-Timing и в лог api.profiling,
+    копит гистограммы по представлениям. Включается настройкой
+    REQUEST_PROFILING.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with self.wrap_connections(profile):
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = (
+            f'{request.method} {match.view_name}' if match
+            else f'{request.method} <unresolved>'
+        )
+        view_stats.observe(view, duration, profile)
+        response['Server-Timing'] = self.server_timing(duration, profile)
+        self.log(request, response, view, duration, profile)
+        return response
+
+    def wrap_connections(self, profile):
+        stack = ExitStack()
+        for db in connections.all():
+            stack.enter_context(db.execute_wrapper(profile))
+        return stack
+
+    def server_timing(self, duration, profile):
+        duplicates = sum(count for _, count in profile.duplicates())
+        return ', '.join((
+            f'db;dur={profile.db_time * 1000:.1f};'
+            f'desc="{profile.queries} queries, {duplicates} duplicated"',
+            f'serializer;dur={profile.serializer_time * 1000:.1f}',
+            f'total;dur={duration * 1000:.1f}',
+        ))
+
+    def log(self, request, response, view, duration, profile):
+        logger.info(json.dumps({
+            'view': view,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 1),
+            'queries': profile.queries,
+            'db_ms': round(profile.db_time * 1000, 1),
+            'serializer_ms': round(profile.serializer_time * 1000, 1),
+            'duplicates': [
+                {'sql': sql[:300], 'count': count}
+                for sql, count in profile.duplicates()[:5]
+            ],
+        }, ensure_ascii=False))
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, их длительность и число обращений к базе
+    по представлению и действию вьюсета для /api/metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+        view, action = getattr(
+            request, 'metrics_view', ('unresolved', '')
+        )
+        metrics.REQUESTS.labels(
+            view, action, request.method, response.status_code
+        ).inc()
+        metrics.REQUEST_DURATION.labels(view, action).observe(duration)
+        metrics.DB_QUERIES.labels(view, action).observe(queries)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        request.metrics_view = (
+            view_class.__name__ if view_class else view_func.__name__,
+            actions.get(request.method.lower(), ''),
+        )
@@ -1,6 +1,58 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPaginator(PageNumberPagination):
     """Класс пагинации страниц."""
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPaginator(CursorPagination):
+    """
+    Курсорная пагинация ленты рецептов по индексу (pub_date, id).
+    Не считает COUNT(*) и не пропускает строки через OFFSET.
+    """
+
+    page_size = settings.RECIPES_PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = settings.RECIPES_MAX_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+
+class FeedCursorPaginator(RecipeCursorPaginator):
+    """Курсорная пагинация ленты подписок."""
+
+    ordering = ('-feed_pub_date', '-feed_recipe')
+
+
+class RecipePaginator(LimitPaginator):
+    """
+    Номерная пагинация рецептов. Параметр cursor (можно пустой)
+    включает курсорную пагинацию. Курсор идёт по (pub_date, id),
+    поэтому с другой сортировкой (ordering, search) он не работает.
+    """
+
+    cursor_query_param = 'cursor'
+
+    def use_cursor(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            if queryset.query.order_by:
+                raise ValidationError({self.cursor_query_param: [
+                    'Курсор работает только с сортировкой по дате '
+                    'публикации, используйте page.'
+                ]})
+            self.cursor_paginator = RecipeCursorPaginator()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        self.cursor_paginator = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,137 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Границы корзин гистограмм, в миллисекундах и в запросах к базе.
+DURATION_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+current_profile = ContextVar('current_profile', default=None)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """
+    Шаблон запроса: параметры Django передаёт отдельно, поэтому
+    достаточно свернуть списки IN разной длины.
+    """
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class RequestProfile:
+    """Запросы к базе и время этапов одного HTTP-запроса."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.fingerprints = Counter()
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self):
+        """Повторяющиеся шаблоны запросов - признак N+1."""
+        return [
+            (sql, count) for sql, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+    @contextmanager
+    def serializer_timer(self):
+        # Вложенные сериализаторы не должны учитываться дважды.
+        self._serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._serializer_depth -= 1
+            if not self._serializer_depth:
+                self.serializer_time += time.perf_counter() - start
+
+
+class TimedSerializerMixin:
+    """Учитывает время сериализации в профиле текущего запроса."""
+
+    def to_representation(self, instance):
+        profile = current_profile.get()
+        if profile is None:
+            return super().to_representation(instance)
+        with profile.serializer_timer():
+            return super().to_representation(instance)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        labels = [str(bucket) for bucket in self.buckets] + ['+Inf']
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'sum': round(self.total, 3),
+        }
+
+
+class ViewStats:
+    """Гистограммы по представлениям в памяти процесса."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, duration, profile):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = {
+                    'count': 0,
+                    'duration_ms': Histogram(DURATION_BUCKETS),
+                    'db_ms': Histogram(DURATION_BUCKETS),
+                    'serializer_ms': Histogram(DURATION_BUCKETS),
+                    'queries': Histogram(QUERY_BUCKETS),
+                    'duplicated_requests': 0,
+                }
+            stats['count'] += 1
+            stats['duration_ms'].observe(duration * 1000)
+            stats['db_ms'].observe(profile.db_time * 1000)
+            stats['serializer_ms'].observe(profile.serializer_time * 1000)
+            stats['queries'].observe(profile.queries)
+            if profile.duplicates():
+                stats['duplicated_requests'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: {
+                    name: value.as_dict()
+                    if isinstance(value, Histogram) else value
+                    for name, value in stats.items()
+                }
+                for view, stats in sorted(self._views.items())
+            }
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+view_stats = ViewStats()
@@ -1,14 +1,26 @@
+import logging
+
 from rest_framework.serializers import (ModelSerializer, CharField,
-                                        PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField, ValidationError)
+                                        IntegerField, ListField,
+                                        ReadOnlyField, Serializer,
+                                        SerializerMethodField,
+                                        ValidationError)
 
 from django.conf import settings
-from recipes.models import Ingredient, IngredientInRecipesAmount, Recipe, Tag
-from users.models import Follow, User
-from .fields import Base64ImageField
+from django.db import transaction
+from recipes import catalog, counters
+from recipes.models import (Ingredient, IngredientInRecipesAmount, Recipe,
+                            ShoppingCartIngredient, Tag)
+from users.models import User
+from recipes.images import schedule_thumbnails
+from .fields import (Base64ImageField, BulkPrimaryKeyRelatedField,
+                     ThumbnailsField)
+from .profiling import TimedSerializerMixin
+
+logger = logging.getLogger(__name__)
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализатор объектов типа Ingredients. Список ингредиентов."""
     class Meta:
         model = Ingredient
@@ -34,7 +46,7 @@ class IngredientsInRecipeReadSerializer(ModelSerializer):
         )
 
 
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа Tags. Список тегов."""
 
     class Meta:
@@ -47,7 +59,7 @@ class TagSerializer(ModelSerializer):
         )
 
 
-class UserSerializer(ModelSerializer):
+class UserSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа User. Просмотр пользователя."""
 
     is_subscribed = SerializerMethodField(read_only=True)
@@ -64,7 +76,8 @@ class UserSerializer(ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -82,10 +95,11 @@ class UserCreateSerializer(ModelSerializer):
             'first_name', 'last_name', 'password',)
 
 
-class ShoppingListFavoiriteSerializer(ModelSerializer):
+class ShoppingListFavoiriteSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа shoppingLists. Лист покупок."""
 
     image = Base64ImageField(read_only=True)
+    image_thumbnails = ThumbnailsField()
     name = ReadOnlyField()
     cooking_time = ReadOnlyField()
 
@@ -95,11 +109,12 @@ class ShoppingListFavoiriteSerializer(ModelSerializer):
             'id',
             'name',
             'image',
+            'image_thumbnails',
             'cooking_time',
         )
 
 
-class FollowSerializer(ModelSerializer):
+class FollowSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа Follow. Проверка подписки."""
 
     email = ReadOnlyField(source='author.email')
@@ -107,9 +122,11 @@ class FollowSerializer(ModelSerializer):
     username = ReadOnlyField(source='author.username')
     first_name = ReadOnlyField(source='author.first_name')
     last_name = ReadOnlyField(source='author.last_name')
-    is_subscribed = SerializerMethodField()
-    recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
+    is_subscribed = ReadOnlyField()
+    recipes = ShoppingListFavoiriteSerializer(
+        many=True, read_only=True, source='author.last_recipes'
+    )
+    recipes_count = ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = User
@@ -124,37 +141,10 @@ class FollowSerializer(ModelSerializer):
             'recipes_count',
         )
 
-    def get_is_subscribed(self, obj):
-        return Follow.objects.filter(user=obj.user, author=obj.author).exists()
-
-    def validate(self, data):
-        author = self.instance
-        user = self.context.get('request').user
-        if Follow.objects.filter(user=user, author=author).exists():
-            raise ValidationError(
-                'Нельзя подписаться на пользователя повторно!'
-            )
-        if user == author:
-            raise ValidationError(
-                'Нельзя подписаться на самого себя!'
-            )
-        return data
-
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
-
-    def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.query_params.get(
-            'recipes_limit', settings.RECIPES_LIMIT
-        )
-        queryset = Recipe.objects.filter(author=obj.author)[:int(limit)]
-        return ShoppingListFavoiriteSerializer(queryset, many=True).data
-
 
 class IngredientsInRecipeWriteSerializer(ModelSerializer):
     """Сериализатор добавления ингредиента в рецепт."""
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
 
     class Meta:
         model = IngredientInRecipesAmount
@@ -164,7 +154,7 @@ class IngredientsInRecipeWriteSerializer(ModelSerializer):
         )
 
 
-class RecipesReadSerializer(ModelSerializer):
+class RecipesReadSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа Recipes. Чтение рецептов."""
 
     is_favorited = SerializerMethodField(read_only=True)
@@ -179,6 +169,7 @@ class RecipesReadSerializer(ModelSerializer):
         read_only=True
     )
     image = Base64ImageField()
+    image_thumbnails = ThumbnailsField()
 
     class Meta:
         model = Recipe
@@ -189,6 +180,7 @@ class RecipesReadSerializer(ModelSerializer):
             'ingredients',
             'name',
             'image',
+            'image_thumbnails',
             'text',
             'cooking_time',
             'is_favorited',
@@ -196,6 +188,8 @@ class RecipesReadSerializer(ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -203,6 +197,8 @@ class RecipesReadSerializer(ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             user.is_authenticated
@@ -210,10 +206,45 @@ class RecipesReadSerializer(ModelSerializer):
         )
 
 
-class RecipesWriteSerializer(ModelSerializer):
+class RecipeMatchSerializer(RecipesReadSerializer):
+    """Рецепт с долей ингредиентов, которые уже есть у пользователя."""
+
+    matched = ReadOnlyField()
+    coverage = ReadOnlyField()
+
+    class Meta(RecipesReadSerializer.Meta):
+        fields = RecipesReadSerializer.Meta.fields + ('matched', 'coverage')
+
+
+class IngredientMatchSerializer(Serializer):
+    """Ингредиенты, которые есть у пользователя."""
+
+    ingredients = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.MATCH_MAX_INGREDIENTS,
+    )
+    limit = IntegerField(
+        min_value=1,
+        max_value=settings.RECIPES_MAX_PAGE_SIZE,
+        default=settings.RECIPES_PAGE_SIZE,
+    )
+
+
+class RecipeIdsSerializer(Serializer):
+    """Пачка рецептов для избранного или списка покупок."""
+
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_RECIPES,
+    )
+
+
+class RecipesWriteSerializer(TimedSerializerMixin, ModelSerializer):
     """Сериализация объектов типа Recipes. Запись рецептов."""
 
-    tags = PrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
+    tags = BulkPrimaryKeyRelatedField(many=True, queryset=Tag.objects.all())
     ingredients = IngredientsInRecipeWriteSerializer(many=True,
                                                      source='recipe')
     image = Base64ImageField()
@@ -234,26 +265,51 @@ class RecipesWriteSerializer(ModelSerializer):
         read_only_fields = ('author',)
 
     def validate(self, data):
-        """Валидация ингредиентов при заполнении рецепта."""
+        """
+        Валидация ингредиентов и тегов при заполнении рецепта.
+        Все ключи проверяются разом, ошибки возвращаются одним ответом.
+        """
         ingredients = data['recipe']
         cooking_time = data['cooking_time']
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise ValidationError({
-                    'Ингредиенты должны быть уникальными'
-                })
-            ingredients_list.append(ingredient_id)
-            amount = ingredient['amount']
-            if int(amount) == settings.ZERO_MIN_VALUE:
-                raise ValidationError({
-                    'Количество ингридиента не может быть = 0'
-                })
+        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        tag_ids = data['tags']
+        found_ingredients = catalog.ingredients.in_bulk(ingredient_ids)
+        found_tags = catalog.tags.in_bulk(tag_ids)
+        seen = set()
+        duplicates = set()
+        for ingredient_id in ingredient_ids:
+            if ingredient_id in seen:
+                duplicates.add(ingredient_id)
+            seen.add(ingredient_id)
+        errors = {}
+        missing = seen - found_ingredients.keys()
+        if missing:
+            errors.setdefault('ingredients', []).append(
+                f'Ингредиентов не существует: {sorted(missing)}'
+            )
+        if duplicates:
+            errors.setdefault('ingredients', []).append(
+                f'Ингредиенты должны быть уникальными: {sorted(duplicates)}'
+            )
+        if any(
+            int(ingredient['amount']) == settings.ZERO_MIN_VALUE
+            for ingredient in ingredients
+        ):
+            errors.setdefault('ingredients', []).append(
+                'Количество ингридиента не может быть = 0'
+            )
+        missing = set(tag_ids) - found_tags.keys()
+        if missing:
+            errors['tags'] = [f'Тегов не существует: {sorted(missing)}']
         if int(cooking_time) == settings.ZERO_MIN_VALUE:
-            raise ValidationError({
+            errors['cooking_time'] = [
                 'Время приготовления не может быть = 0!'
-            })
+            ]
+        if errors:
+            raise ValidationError(errors)
+        for ingredient in ingredients:
+            ingredient['id'] = found_ingredients[ingredient['id']]
+        data['tags'] = [found_tags[tag_id] for tag_id in tag_ids]
         return data
 
     def validate_name(self, value):
@@ -272,26 +328,101 @@ class RecipesWriteSerializer(ModelSerializer):
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe')
         user = self.context.get('request').user
-        recipe = Recipe.objects.create(author=user, **validated_data)
+        recipe = Recipe.objects.create(
+            author=user, ingredients_count=len(ingredients), **validated_data
+        )
         recipe.tags.set(tags)
         self.create_update_ingredient(ingredients, recipe)
+        schedule_thumbnails(recipe)
         return recipe
 
+    def update_tags(self, tags, recipe):
+        """Добавляет и удаляет только изменившиеся теги."""
+        current = set(recipe.tags.values_list('pk', flat=True))
+        new = {tag.pk for tag in tags}
+        removed, added = current - new, new - current
+        if removed:
+            recipe.tags.remove(*removed)
+        if added:
+            recipe.tags.add(*added)
+        return {'created': len(added), 'updated': 0, 'deleted': len(removed)}
+
+    def update_ingredients(self, ingredients, recipe):
+        """
+        Сравнивает ингредиенты с сохранёнными: меняет только изменившиеся
+        количества, удаляет убранные и добавляет новые строки.
+        """
+        existing = {row.ingredient_id: row for row in recipe.recipe.all()}
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        new_amounts = {
+            ingredient['id'].pk: ingredient['amount']
+            for ingredient in ingredients
+        }
+        to_update = []
+        for ingredient_id, row in existing.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and amount != row.amount:
+                row.amount = amount
+                to_update.append(row)
+        to_delete = [
+            row.pk for ingredient_id, row in existing.items()
+            if ingredient_id not in new_amounts
+        ]
+        to_create = [
+            IngredientInRecipesAmount(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in existing
+        ]
+        IngredientInRecipesAmount.objects.bulk_update(to_update, ['amount'])
+        IngredientInRecipesAmount.objects.filter(pk__in=to_delete).delete()
+        IngredientInRecipesAmount.objects.bulk_create(to_create)
+        # Удалённые строки учитывают сигналы, bulk_create их не отправляет.
+        counters.rows_changed(
+            IngredientInRecipesAmount, [recipe.pk] * len(to_create), 1
+        )
+        ShoppingCartIngredient.objects.change_recipe(
+            recipe, old_amounts, new_amounts
+        )
+        return {
+            'created': len(to_create),
+            'updated': len(to_update),
+            'deleted': len(to_delete),
+        }
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         request = self.context.get('request')
         if (
             request.user.is_authenticated
             and request.user.id == instance.author_id
         ):
-            tags = validated_data.pop('tags')
-            instance.tags.clear()
-            instance.tags.set(tags)
             ingredients = validated_data.pop('recipe')
-            instance.ingredients.clear()
-            self.create_update_ingredient(ingredients, instance)
-            return super().update(instance, validated_data)
+            self.rows_touched = {
+                'tags': self.update_tags(
+                    validated_data.pop('tags'), instance
+                ),
+                'ingredients': self.update_ingredients(
+                    ingredients, instance
+                ),
+            }
+            if 'image' in validated_data:
+                validated_data['thumbnails'] = {}
+            logger.info(
+                'Рецепт %s обновлён, затронуто строк: %s',
+                instance.pk, self.rows_touched,
+            )
+            instance = super().update(instance, validated_data)
+            if 'image' in validated_data:
+                schedule_thumbnails(instance)
+            return instance
         return instance
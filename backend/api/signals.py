@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+from .authentication import invalidate_user
+
+
+@receiver((post_save, post_delete), sender=User)
+def invalidate_user_tokens(instance, **kwargs):
+    """Смена пароля, блокировка и любые правки профиля."""
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(instance, **kwargs):
+    """Выход через token_destroy удаляет токен."""
+    invalidate_user(instance.user_id)
@@ -0,0 +1,650 @@
+import base64
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import token_cache
+from recipes.models import (FavoriteReceipe, FeedItem, Ingredient,
+                            IngredientInRecipesAmount, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from users.models import Follow, User
+
+
+IMAGE = 'data:image/png;base64,' + base64.b64encode(
+    b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00'
+    b'\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\x0cIDATx'
+    b'\x9cc\xf8\xcf\xc0\x00\x00\x03\x01\x01\x00\xc9\xfe\x92\xef\x00'
+    b'\x00\x00\x00IEND\xaeB`\x82'
+).decode()
+
+
+class RecipeDataMixin:
+    """Авторы, теги, ингредиенты и рецепты для тестов API."""
+
+    @classmethod
+    def create_recipes(cls, author, count, ingredients_per_recipe=3):
+        recipes = []
+        for number in range(count):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/test.png',
+                ingredients_count=ingredients_per_recipe,
+            )
+            recipe.tags.set(cls.tags)
+            IngredientInRecipesAmount.objects.bulk_create(
+                IngredientInRecipesAmount(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in cls.ingredients[:ingredients_per_recipe]
+            )
+            recipes.append(recipe)
+        return recipes
+
+    @classmethod
+    def create_catalog(cls):
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('Завтрак', '#E26C2D', 'breakfast'),
+                ('Обед', '#49B64E', 'lunch'),
+            )
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(50)
+        ]
+
+    def client_for(self, user):
+        client = APIClient()
+        if user is not None:
+            token, _ = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def reset_caches(self):
+        """Холодные кэши: ответы, справочники и токены."""
+        cache.clear()
+        token_cache.clear()
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    """Число запросов к базе в списке рецептов не зависит от страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader', password='pass'
+        )
+        recipes = cls.create_recipes(cls.author, 60)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for recipe in recipes[::2]:
+            FavoriteReceipe.objects.create(user=cls.reader, recipe=recipe)
+        for recipe in recipes[::3]:
+            ShoppingCart.objects.create(user=cls.reader, recipe=recipe)
+
+    def assert_list_queries(self, user, queries):
+        client = self.client_for(user)
+        for limit in (1, 50):
+            self.reset_caches()
+            with self.subTest(limit=limit), self.assertNumQueries(queries):
+                response = client.get('/api/recipes/', {'limit': limit})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(None, 8)
+
+    def test_authenticated(self):
+        self.assert_list_queries(self.reader, 10)
+
+
+class IngredientAutocompleteTest(APITestCase):
+    """Автодополнение: сначала начало названия, затем подстрока."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Salt', 'salami', 'Sea salt', 'Basalt', 'Sugar')
+        )
+
+    def names(self, name, limit):
+        response = self.client.get(
+            '/api/ingredients/', {'name': name, 'limit': limit}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_first(self):
+        self.assertEqual(self.names('sal', 10), [
+            'salami', 'Salt', 'Basalt', 'Sea salt',
+        ])
+
+    def test_prefix_fills_limit(self):
+        self.assertEqual(self.names('sal', 2), ['salami', 'Salt'])
+        self.assertEqual(self.names('sal', 3), ['salami', 'Salt', 'Basalt'])
+
+
+class ShoppingCartDownloadTest(RecipeDataMixin, APITestCase):
+    """Выгрузка списка покупок в разных форматах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        recipe, = cls.create_recipes(cls.author, 1, ingredients_per_recipe=40)
+        ShoppingCart.objects.create(user=cls.author, recipe=recipe)
+
+    def download(self, file_format):
+        response = self.client_for(self.author).get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response['Content-Type'], b''.join(response.streaming_content)
+
+    def test_formats(self):
+        content_type, content = self.download('txt')
+        self.assertEqual(content_type, 'text/plain; charset=utf-8')
+        self.assertIn('Ингредиент 39 - 1 (г)'.encode(), content)
+        content_type, content = self.download('csv')
+        self.assertEqual(content_type, 'text/csv; charset=utf-8')
+        self.assertEqual(len(content.decode().splitlines()), 41)
+        content_type, content = self.download('pdf')
+        self.assertEqual(content_type, 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+
+class RecipeCursorTest(RecipeDataMixin, APITestCase):
+    """Курсорная пагинация только для сортировки по дате."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        cls.create_recipes(cls.author, 5)
+
+    def get(self, **params):
+        return self.client_for(None).get('/api/recipes/', params)
+
+    def test_cursor_by_date(self):
+        response = self.get(cursor='', limit=2, tags='breakfast')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            list(Recipe.objects.values_list('pk', flat=True)[:2]),
+        )
+
+    def test_cursor_with_other_ordering(self):
+        for params in ({'ordering': 'popular'}, {'search': 'рецепт'}):
+            with self.subTest(**params):
+                response = self.get(cursor='', limit=2, **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+                self.assertEqual(
+                    self.get(page=1, limit=2, **params).status_code, 200
+                )
+
+
+class RecipeCreateTest(RecipeDataMixin, APITestCase):
+    """Создание рецепта: запросы к базе и ошибки валидации."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+
+    def recipe_data(self, ingredients):
+        return {
+            'name': 'Рецепт',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [tag.pk for tag in self.tags],
+            'ingredients': ingredients,
+        }
+
+    def test_create_queries_do_not_depend_on_ingredients(self):
+        client = self.client_for(self.author)
+        for count in (5, 40):
+            self.reset_caches()
+            ingredients = [
+                {'id': ingredient.pk, 'amount': 10}
+                for ingredient in self.ingredients[:count]
+            ]
+            with self.subTest(ingredients=count), self.assertNumQueries(16):
+                response = client.post(
+                    '/api/recipes/', self.recipe_data(ingredients),
+                    format='json',
+                )
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertEqual(
+                Recipe.objects.get(pk=response.data['id']).recipe.count(),
+                count,
+            )
+
+    def test_errors_are_reported_together(self):
+        first, second = self.ingredients[:2]
+        response = self.client_for(self.author).post(
+            '/api/recipes/',
+            self.recipe_data([
+                {'id': 99999, 'amount': 1},
+                {'id': first.pk, 'amount': 1},
+                {'id': first.pk, 'amount': 2},
+                {'id': second.pk, 'amount': 0},
+            ]),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['ingredients'], [
+            'Ингредиентов не существует: [99999]',
+            f'Ингредиенты должны быть уникальными: [{first.pk}]',
+            'Количество ингридиента не может быть = 0',
+        ])
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeSearchTest(RecipeDataMixin, APITestCase):
+    """Поисковый индекс обновляют сигналы, а не только API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+
+    def search(self, text):
+        response = self.client_for(None).get(
+            '/api/recipes/', {'search': text, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_orm_changes_are_indexed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe, = self.create_recipes(self.author, 1)
+            recipe.name = 'Окрошка'
+            recipe.save()
+            IngredientInRecipesAmount.objects.create(
+                recipe=recipe, ingredient=self.ingredients[10], amount=5
+            )
+        self.assertEqual(self.search('окрошка'), [recipe.pk])
+        self.assertEqual(self.search('Ингредиент 10'), [recipe.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            IngredientInRecipesAmount.objects.filter(
+                recipe=recipe, ingredient=self.ingredients[10]
+            ).delete()
+        self.assertEqual(self.search('Ингредиент 10'), [])
+
+
+class RecipeMatchTest(RecipeDataMixin, APITestCase):
+    """Подбор рецептов по ингредиентам и счётчик ингредиентов рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+
+    def match(self, ingredients):
+        response = self.client_for(None).post(
+            '/api/recipes/match/', {'ingredients': ingredients},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['id'], recipe['coverage']) for recipe in response.data
+        ]
+
+    def test_ingredients_count_follows_orm_changes(self):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/test.png',
+        )
+        first, second = self.ingredients[:2]
+        for ingredient in (first, second):
+            IngredientInRecipesAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredients_count, 2)
+        self.assertEqual(self.match([first.pk]), [(recipe.pk, 0.5)])
+        IngredientInRecipesAmount.objects.filter(
+            recipe=recipe, ingredient=second
+        ).delete()
+        self.assertEqual(self.match([first.pk]), [(recipe.pk, 1.0)])
+
+    def test_zero_ingredients_count(self):
+        recipe, = self.create_recipes(self.author, 1)
+        Recipe.objects.filter(pk=recipe.pk).update(ingredients_count=0)
+        self.assertEqual(
+            self.match([self.ingredients[0].pk]), [(recipe.pk, None)]
+        )
+
+
+class CounterFieldsTest(RecipeDataMixin, APITestCase):
+    """Сохранение устаревшего объекта не затирает счётчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        cls.reader = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader', password='pass'
+        )
+        cls.recipe, = cls.create_recipes(cls.author, 1)
+
+    def test_stale_user_save(self):
+        author = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        author.first_name = 'Автор'
+        author.save()
+        author.refresh_from_db()
+        self.assertEqual(author.first_name, 'Автор')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+
+    def test_stale_recipe_save(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        FavoriteReceipe.objects.create(user=self.reader, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+
+    def test_set_password_keeps_followers(self):
+        # Первый запрос кладёт пользователя в кэш токенов, дальше
+        # запросы получают его копию со старыми счётчиками.
+        client = self.client_for(self.author)
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.client_for(self.reader).post(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        response = client.post('/api/users/set_password/', {
+            'current_password': 'pass', 'new_password': 'Nw-pass-8431',
+        })
+        self.assertEqual(response.status_code, 204, response.data)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_update_keeps_ingredients_count(self):
+        response = self.client_for(self.author).patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+                'tags': [tag.pk for tag in self.tags],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 5}
+                    for ingredient in self.ingredients[1:6]
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredients_count, 5)
+
+
+@override_settings(SHOPPING_CART_BATCH_SIZE=4)
+class ShoppingCartTotalsTest(RecipeDataMixin, APITestCase):
+    """Суммы в списках покупок пересчитываются пачками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        cls.recipe, = cls.create_recipes(cls.author, 1, 5)
+        for number in range(7):
+            reader = User.objects.create_user(
+                email=f'reader{number}@foodgram.ru',
+                username=f'reader{number}',
+                password='pass',
+            )
+            ShoppingCart.objects.create(user=reader, recipe=cls.recipe)
+
+    def assert_totals(self):
+        totals = ShoppingCartIngredient.objects
+        self.assertEqual(totals.stored_totals(), totals.live_totals())
+
+    def update_recipe(self, ingredients):
+        return self.client_for(self.author).patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+                'tags': [tag.pk for tag in self.tags],
+                'ingredients': [
+                    {'id': ingredient.pk, 'amount': 1 + number % 2}
+                    for number, ingredient in enumerate(ingredients)
+                ],
+            },
+            format='json',
+        )
+
+    def test_change_recipe(self):
+        self.assert_totals()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.update_recipe(self.ingredients[2:9])
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assert_totals()
+        self.assertEqual(ShoppingCartIngredient.objects.count(), 7 * 7)
+        table = ShoppingCartIngredient._meta.db_table
+        upserts = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(f'INSERT INTO "{table}"')
+        ]
+        self.assertTrue(upserts)
+        for sql in upserts:
+            self.assertLessEqual(sql.count('), ('), 3)
+
+    def test_remove_recipe(self):
+        ShoppingCart.objects.all().delete()
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTest(RecipeDataMixin, APITestCase):
+    """Лента склеивает записи ленты и рецепты популярных авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_catalog()
+        cls.reader, cls.other, cls.author, cls.popular = (
+            User.objects.create_user(
+                email=f'{name}@foodgram.ru', username=name, password='pass'
+            )
+            for name in ('reader', 'other', 'author', 'popular')
+        )
+        # Рецепт до подписки попадает в ленту читателя при подписке.
+        cls.create_recipes(cls.popular, 1)
+        for user, author in (
+            (cls.reader, cls.author),
+            (cls.reader, cls.popular),
+            (cls.other, cls.popular),
+        ):
+            Follow.objects.create(user=user, author=author)
+        cls.create_recipes(cls.author, 3)
+        cls.create_recipes(cls.popular, 3)
+
+    def feed_ids(self):
+        client = self.client_for(self.reader)
+        ids, url = [], '/api/recipes/feed/?limit=2'
+        while url:
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def expected_ids(self):
+        return list(Recipe.objects.filter(
+            author__in=(self.author, self.popular)
+        ).order_by('-pub_date', '-id').values_list('pk', flat=True))
+
+    def test_merged_pages(self):
+        self.assertEqual(
+            FeedItem.objects.filter(
+                user=self.reader, recipe__author=self.popular
+            ).count(),
+            1,
+        )
+        self.assertEqual(self.feed_ids(), self.expected_ids())
+
+    def test_author_returns_to_fan_out(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.filter(user=self.other).delete()
+        self.assertEqual(
+            set(FeedItem.objects.filter(user=self.reader).values_list(
+                'recipe', flat=True
+            )),
+            set(self.expected_ids()),
+        )
+        self.assertEqual(self.feed_ids(), self.expected_ids())
+
+
+class ConcurrentTogglesTest(RecipeDataMixin, TransactionTestCase):
+    """
+    Одновременные одинаковые запросы из нескольких потоков: ровно один
+    меняет данные, счётчики, списки покупок и ленты остаются верными.
+    """
+
+    threads = 8
+
+    def setUp(self):
+        self.reset_caches()
+        self.create_catalog()
+        self.author = User.objects.create_user(
+            email='author@foodgram.ru', username='author', password='pass'
+        )
+        self.reader = User.objects.create_user(
+            email='reader@foodgram.ru', username='reader', password='pass'
+        )
+        self.recipes = self.create_recipes(self.author, 3)
+        self.recipe = self.recipes[0]
+
+    def hammer(self, method, url):
+        """Все потоки отправляют запрос одновременно, после барьера."""
+        clients = [self.client_for(self.reader) for _ in range(self.threads)]
+        barrier = threading.Barrier(self.threads)
+
+        def request(client):
+            try:
+                barrier.wait()
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as pool:
+            return Counter(pool.map(request, clients))
+
+    def assert_once(self, method, url, status):
+        self.assertEqual(
+            self.hammer(method, url),
+            Counter({status: 1, 400: self.threads - 1}),
+        )
+
+    def test_favorite(self):
+        url = f'/api/recipes/{self.recipe.pk}/favorite/'
+        self.assert_once('post', url, 201)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 1)
+        self.assertEqual(FavoriteReceipe.objects.count(), 1)
+        self.assert_once('delete', url, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+        self.assertFalse(FavoriteReceipe.objects.exists())
+
+    def test_shopping_cart(self):
+        url = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        self.assert_once('post', url, 201)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 1)
+        self.assertEqual(
+            set(ShoppingCartIngredient.objects.filter(
+                user=self.reader
+            ).values_list('ingredient', 'amount')),
+            set(self.recipe.recipe.values_list('ingredient', 'amount')),
+        )
+        self.assert_once('delete', url, 204)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.in_carts_count, 0)
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+    def test_subscribe(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        self.assert_once('post', url, 201)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(
+            FeedItem.objects.filter(user=self.reader).count(),
+            len(self.recipes),
+        )
+        self.assert_once('delete', url, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+
+
+class MetricsTest(APITestCase):
+    """Метрики отдаются только с токеном."""
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/api/metrics').status_code, 404)
+        self.assertEqual(self.client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer wrong'
+        ).status_code, 404)
+        self.assertEqual(self.client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer secret'
+        ).status_code, 200)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get(
+            '/api/metrics', HTTP_AUTHORIZATION='Bearer '
+        ).status_code, 404)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import IngredientsViewSet, RecipeViewSet, TagsViewSet, UsersViewSet
+from .views import (IngredientsViewSet, ProfilingView, RecipeViewSet,
+                    TagsViewSet, UsersViewSet, metrics_view)
 
 app_name = 'api'
 router = DefaultRouter()
@@ -12,6 +13,8 @@ router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('ingredients', IngredientsViewSet, basename='ingredients')
 
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
+    path('profiling/', ProfilingView.as_view(), name='profiling'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
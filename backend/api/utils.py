@@ -1,20 +1,146 @@
-from django.shortcuts import HttpResponse
+import csv
+import io
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from rest_framework.renderers import BaseRenderer
 
-def shopping_cart_file(ingredients):
-    """Загрузка списка покупок с ингредиентами."""
+CHUNK_SIZE = 8192
 
-    shopping_list = 'Список покупок: \n'
+
+class ShoppingCartRenderer(BaseRenderer):
+    """
+    Рендерер формата выгрузки списка покупок.
+    Сам файл отдаётся потоком, через рендерер проходят только ошибки.
+    """
+
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if isinstance(data, dict) and 'detail' in data:
+            data = data['detail']
+        return str(data).encode(self.charset)
+
+
+class ShoppingCartTxtRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class ShoppingCartCsvRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class ShoppingCartPdfRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class Echo:
+    """Буфер для csv.writer, который просто возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(ingredients):
+    yield 'Список покупок: \n'
     for ingredient in ingredients:
-        shopping_list += (
+        yield (
             f'{ingredient["ingredient__name"]} - '
             f'{ingredient["amount_sum"]} '
             f'({ingredient["ingredient__measurement_unit"]}) \n'
         )
-        response = HttpResponse(
-            shopping_list, content_type='text/plain; charset=utf8'
+
+
+def shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Количество', 'Единица измерения'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['amount_sum'],
+            ingredient['ingredient__measurement_unit'],
+        ))
+
+
+PDF_FONT = 'ShoppingCartFont'
+PDF_FONT_SIZE = 11
+PDF_MARGIN = 50
+
+
+def pdf_font():
+    """Шрифт с кириллицей регистрируется при первой выгрузке."""
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT, settings.SHOPPING_CART_PDF_FONT)
         )
-        response[
-            'Content-Disposition'
-        ] = 'attachment; filename="shopping_cart.txt"'
+    return PDF_FONT
+
+
+def shopping_cart_pdf(ingredients):
+    """
+    Строки читаются из iterator() и рисуются страница за страницей, но
+    PDF отдаётся после сборки: таблица ссылок и подмножество шрифта
+    пишутся в конец файла. Строк не больше, чем ингредиентов
+    в справочнике, так что размер документа ограничен.
+    """
+    buffer = io.BytesIO()
+    canvas = Canvas(buffer, pagesize=A4)
+    _, height = A4
+    leading = PDF_FONT_SIZE * 1.5
+    canvas.setFont(pdf_font(), PDF_FONT_SIZE)
+    y = height - PDF_MARGIN
+    for line in shopping_cart_txt(ingredients):
+        if y < PDF_MARGIN:
+            canvas.showPage()
+            canvas.setFont(PDF_FONT, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        canvas.drawString(PDF_MARGIN, y, line.strip())
+        y -= leading
+    canvas.save()
+    content = buffer.getbuffer()
+    for start in range(0, len(content), CHUNK_SIZE):
+        yield bytes(content[start:start + CHUNK_SIZE])
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': (shopping_cart_txt, 'text/plain; charset=utf-8'),
+    'csv': (shopping_cart_csv, 'text/csv; charset=utf-8'),
+    'pdf': (shopping_cart_pdf, 'application/pdf'),
+}
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    """Склеивает строки (str или bytes) в куски примерно по size."""
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield line[:0].join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield buffer[0][:0].join(buffer)
+
+
+def shopping_cart_file(ingredients, file_format='txt'):
+    """Потоковая загрузка списка покупок с ингредиентами."""
+
+    lines, content_type = SHOPPING_CART_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        chunked(lines(ingredients.iterator())), content_type=content_type
+    )
+    response[
+        'Content-Disposition'
+    ] = f'attachment; filename="shopping_cart.{file_format}"'
     return response
@@ -1,40 +1,126 @@
-from django.db.models import Sum
+import os
+
+from django.conf import settings
+from django.db.models import (BooleanField, F, OuterRef, Prefetch, Subquery,
+                              Value)
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated, SAFE_METHODS)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from recipes.models import (FavoriteReceipe, Ingredient,
-                            IngredientInRecipesAmount, Recipe, ShoppingCart,
-                            Tag)
+from foodgram import metrics
+from recipes import catalog, toggles
+from recipes.feed import feed_queryset
+from recipes.matching import match_recipes
+from recipes.models import (FavoriteReceipe, Ingredient, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
 from users.models import Follow, User
 
+from .cache import LIGHT_FIELDS, RecipeBodies, conditional, digest
 from .filters import RecipeFilter, IngredientFilter
-from .pagination import LimitPaginator
+from .pagination import FeedCursorPaginator, LimitPaginator, RecipePaginator
 from .permission import OwnerOrReadOnly
-from .serializers import (FollowSerializer, IngredientSerializer,
-                          RecipesReadSerializer, RecipesWriteSerializer,
+from .profiling import view_stats
+from .serializers import (FollowSerializer, IngredientMatchSerializer,
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeMatchSerializer, RecipesReadSerializer,
+                          RecipesWriteSerializer,
                           ShoppingListFavoiriteSerializer, TagSerializer,
                           UserSerializer)
-from .utils import shopping_cart_file
+from .utils import (SHOPPING_CART_FORMATS, ShoppingCartCsvRenderer,
+                    ShoppingCartPdfRenderer, ShoppingCartTxtRenderer,
+                    shopping_cart_file)
+
+
+def object_id(value):
+    """Ключ объекта из адреса; нечисловой ключ - 404."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
+
+
+def link_unchanged(model, pk, message):
+    """
+    Связь не добавилась или не удалилась: объекта нет - 404,
+    иначе связь уже была в нужном состоянии - 400.
+    """
+    if not model.objects.filter(pk=pk).exists():
+        raise Http404
+    return Response({'errors': message}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TagsViewSet(viewsets.ModelViewSet):
+class CatalogReadMixin:
+    """Чтение справочника из памяти процесса с поддержкой ETag."""
+
+    catalog = None
+
+    def use_catalog(self, request):
+        return True
+
+    def catalog_response(self, request, get_data):
+        etag = self.catalog.etag()
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        not_modified = etag in if_none_match or '*' in if_none_match
+        metrics.cache_result('http_etag', not_modified)
+        if not_modified:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(get_data())
+        response['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_catalog(request):
+            return super().list(request, *args, **kwargs)
+        return self.catalog_response(request, lambda: self.catalog.derived(
+            'list',
+            lambda items: list(self.get_serializer(items, many=True).data),
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            instance = self.catalog.get(int(kwargs[self.lookup_field]))
+        except ValueError:
+            instance = None
+        if instance is None:
+            raise Http404
+        return self.catalog_response(
+            request, lambda: self.get_serializer(instance).data
+        )
+
+
+class TagsViewSet(CatalogReadMixin, viewsets.ModelViewSet):
     """Класс взаимодействия с моделью Tags. Вьюсет для списка тегов."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    catalog = catalog.tags
 
 
-class IngredientsViewSet(viewsets.ModelViewSet):
+class IngredientsViewSet(CatalogReadMixin, viewsets.ModelViewSet):
     """Класс взаимодействия с Ingredients. Вьюсет для ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [IngredientFilter]
-    search_fields = ('^name', )
+    catalog = catalog.ingredients
+
+    def use_catalog(self, request):
+        """Поиск по названию идёт в базу, по индексам автодополнения."""
+        return not any(
+            param in request.query_params
+            for param in (IngredientFilter.search_param,
+                          IngredientFilter.limit_param)
+        )
 
 
 class UsersViewSet(UserViewSet):
@@ -52,6 +138,35 @@ class UsersViewSet(UserViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_recipes_limit(self):
+        try:
+            limit = int(self.request.query_params.get(
+                'recipes_limit', settings.RECIPES_LIMIT
+            ))
+        except ValueError:
+            limit = settings.RECIPES_LIMIT
+        return max(limit, 0)
+
+    def get_subscriptions_queryset(self, user):
+        """Подписки с последними рецептами авторов."""
+        limit = self.get_recipes_limit()
+        recipes = Recipe.objects.none()
+        if limit:
+            recipes = Recipe.objects.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:limit]
+            ))
+        return Follow.objects.filter(user=user).select_related(
+            'author'
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).order_by('id').prefetch_related(
+            Prefetch(
+                'author__recipes', queryset=recipes, to_attr='last_recipes'
+            )
+        )
+
     @action(
         methods=['GET'], detail=False,
         permission_classes=(IsAuthenticated,),
@@ -59,7 +174,7 @@ class UsersViewSet(UserViewSet):
     )
     def subscriptions(self, request):
         user = self.request.user
-        queryset = Follow.objects.filter(user=user)
+        queryset = self.get_subscriptions_queryset(user)
         page = self.paginate_queryset(queryset)
         serializer = FollowSerializer(
             page, many=True, context={'request': request}
@@ -72,16 +187,29 @@ class UsersViewSet(UserViewSet):
     )
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
+        author_id = object_id(id)
         if request.method == 'POST':
+            if author_id == user.pk:
+                return Response(
+                    {'errors': 'Нельзя подписаться на самого себя!'},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not toggles.add(Follow, user, [author_id]):
+                return link_unchanged(
+                    User, author_id,
+                    'Нельзя подписаться на пользователя повторно!',
+                )
             serializer = FollowSerializer(
-                Follow.objects.create(user=user, author=author),
+                self.get_subscriptions_queryset(user).get(author=author_id),
                 context={'request': request},
             )
             return Response(
                 serializer.data, status=status.HTTP_201_CREATED
             )
-        Follow.objects.filter(user=user, author=author).delete()
+        if not toggles.remove(Follow, user, [author_id]):
+            return link_unchanged(
+                User, author_id, 'Вы не подписаны на этого пользователя!'
+            )
         return Response('Успешная отписка', status=status.HTTP_204_NO_CONTENT)
 
 
@@ -91,8 +219,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
-    permission_class = (OwnerOrReadOnly,)
-    pagination_class = LimitPaginator
+    permission_classes = (OwnerOrReadOnly,)
+    pagination_class = RecipePaginator
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            # Тела рецептов собирает RecipeBodies, здесь нужны только
+            # ключи, версии и признаки пользователя.
+            return Recipe.objects.only(*LIGHT_FIELDS).with_user_flags(
+                self.request.user
+            )
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read(self.request.user)
+        return super().get_queryset()
+
+    def recipe_bodies(self):
+        return RecipeBodies(
+            RecipesReadSerializer, self.get_serializer_context()
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            data, etag = self.recipe_bodies().represent(list(queryset))
+            return conditional(request, Response(data), etag)
+        data, etag = self.recipe_bodies().represent(page)
+        response = self.get_paginated_response(data)
+        # В ETag страницы входят и ссылки пагинации.
+        etag = '"{}"'.format(digest(etag, *(
+            value for key, value in response.data.items()
+            if key != 'results'
+        )))
+        return conditional(request, response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        data, etag = self.recipe_bodies().represent([recipe])
+        if not data:
+            raise Http404
+        return conditional(request, Response(data[0]), etag, recipe.updated)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -100,40 +266,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipesWriteSerializer
 
     def add_delete_recipe(self, request, pk, model):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        user = self.request.user
+        recipe_id = object_id(pk)
+        user = request.user
         if request.method == 'POST':
-            serializer = ShoppingListFavoiriteSerializer(recipe)
-            if model.objects.filter(
-                    user=user, recipe=recipe
-            ).exists():
-                return Response(
-                    {'errors': 'Рецепт уже добавлен!'},
-                    status=status.HTTP_400_BAD_REQUEST,
+            if not toggles.add(model, user, [recipe_id]):
+                return link_unchanged(
+                    Recipe, recipe_id, 'Рецепт уже добавлен!'
                 )
-            else:
-                model.objects.create(
-                    user=user, recipe=recipe
-                )
-                return Response(
-                    serializer.data,
-                    status=status.HTTP_201_CREATED)
-        if model.objects.filter(
-            user=user, recipe=recipe
-        ).exists():
-            model.objects.get(
-                user=user, recipe=recipe
-            ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        else:
-            return Response(
-                {'errors': 'Рецепт уже удален!'},
-                status=status.HTTP_400_BAD_REQUEST,
+            serializer = ShoppingListFavoiriteSerializer(
+                get_object_or_404(Recipe, pk=recipe_id)
             )
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if not toggles.remove(model, user, [recipe_id]):
+            return link_unchanged(Recipe, recipe_id, 'Рецепт уже удален!')
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
-        permission_class=(IsAuthenticated,),
+        permission_classes=(IsAuthenticated,),
     )
     def favorite(self, request, **kwargs):
         return self.add_delete_recipe(
@@ -141,25 +291,147 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         methods=['POST', 'DELETE'], detail=True,
+        permission_classes=(IsAuthenticated,),
     )
     def shopping_cart(self, request, **kwargs):
         return self.add_delete_recipe(
             request, kwargs.pop('pk'), ShoppingCart)
 
+    def add_delete_recipes(self, request, model):
+        """
+        Добавляет или убирает пачку рецептов одним запросом к таблице
+        связей. Результат по каждому рецепту: added/exists при
+        добавлении, removed/absent при удалении, not_found - рецепта нет.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(
+            serializer.validated_data['recipes']
+        ))
+        if request.method == 'POST':
+            changed = toggles.add(model, request.user, recipe_ids)
+            done, unchanged = 'added', 'exists'
+        else:
+            changed = toggles.remove(model, request.user, recipe_ids)
+            done, unchanged = 'removed', 'absent'
+        changed = set(changed)
+        rest = [pk for pk in recipe_ids if pk not in changed]
+        existing = set(
+            Recipe.objects.filter(pk__in=rest).values_list('pk', flat=True)
+        ) if rest else set()
+        return Response([
+            {
+                'id': pk,
+                'status': (
+                    done if pk in changed
+                    else unchanged if pk in existing
+                    else 'not_found'
+                ),
+            }
+            for pk in recipe_ids
+        ])
+
     @action(
-        methods=['GET'], detail=False,
-        permission_class=(IsAuthenticated,)
+        methods=['POST', 'DELETE'], detail=False, url_path='favorite',
+        url_name='favorite-batch', permission_classes=(IsAuthenticated,),
     )
-    def download_shopping_cart(self, request):
-        ingredients = IngredientInRecipesAmount.objects.select_related(
-            'recipe', 'ingredient'
-        )
-        ingredients = ingredients.filter(
-            recipe__shopping_recipes__user=request.user
+    def favorite_batch(self, request):
+        return self.add_delete_recipes(request, FavoriteReceipe)
+
+    @action(
+        methods=['POST', 'DELETE'], detail=False, url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return self.add_delete_recipes(request, ShoppingCart)
+
+    @action(
+        methods=['POST'], detail=False,
+        permission_classes=(AllowAny,),
+    )
+    def match(self, request):
+        """Рецепты по доле ингредиентов, которые уже есть."""
+        serializer = IngredientMatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        matches = match_recipes(
+            set(serializer.validated_data['ingredients']),
+            serializer.validated_data['limit'],
         )
-        ingredients = ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit'
+        recipes = Recipe.objects.for_read(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
         )
-        ingredients = ingredients.annotate(amount_sum=Sum('amount'))
-        ingredients = ingredients.order_by('ingredient__name')
-        return shopping_cart_file(ingredients)
+        ranked = []
+        for recipe_id, matched, coverage in matches:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched, recipe.coverage = matched, coverage
+            ranked.append(recipe)
+        return Response(RecipeMatchSerializer(
+            ranked, many=True, context=self.get_serializer_context()
+        ).data)
+
+    @action(
+        methods=['GET'], detail=False,
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        """Новые рецепты авторов, на которых подписан пользователь."""
+        queryset = feed_queryset(self.get_queryset(), request.user)
+        paginator = FeedCursorPaginator()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['GET'], detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingCartTxtRenderer, ShoppingCartCsvRenderer,
+                          ShoppingCartPdfRenderer, JSONRenderer),
+    )
+    def download_shopping_cart(self, request):
+        ingredients = ShoppingCartIngredient.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            amount_sum=F('amount'),
+        ).order_by('ingredient__name')
+        file_format = request.accepted_renderer.format
+        if file_format not in SHOPPING_CART_FORMATS:
+            file_format = 'txt'
+        return shopping_cart_file(ingredients, file_format)
+
+
+class ProfilingView(APIView):
+    """
+    Гистограммы времени и запросов к базе по представлениям.
+    Копятся в памяти процесса, который обслужил запрос.
+    """
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response({
+            'enabled': settings.REQUEST_PROFILING,
+            'pid': os.getpid(),
+            'views': view_stats.snapshot(),
+        })
+
+    def delete(self, request):
+        view_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus. Без верного токена
+    METRICS_TOKEN отвечает 404, как будто адреса нет.
+    """
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        raise Http404
+    content, content_type = metrics.exposition()
+    return HttpResponse(content, content_type=content_type)
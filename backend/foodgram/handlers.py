@@ -0,0 +1,103 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections, connections
+
+# Потоки пула живут долго: с DB_CONN_MAX_AGE соединения с базой
+# переиспользуются между запросами.
+executor = ThreadPoolExecutor(
+    max_workers=settings.ASGI_THREADS, thread_name_prefix='asgi'
+)
+
+
+def call_in_pool(func, *args):
+    close_old_connections()
+    try:
+        return func(*args)
+    finally:
+        close_old_connections()
+
+
+def run_in_pool(func, *args):
+    return sync_to_async(
+        functools.partial(call_in_pool, func),
+        thread_sensitive=False,
+        executor=executor,
+    )(*args)
+
+
+def next_part(iterator):
+    return next(iterator, None)
+
+
+def close_stream(response):
+    try:
+        response.close()
+    finally:
+        connections.close_all()
+
+
+class PooledASGIHandler(ASGIHandler):
+    """
+    ASGI-обработчик для Django 3.2, где нет асинхронного ORM.
+
+    Стандартный обработчик выполняет синхронный код (каждый шаг
+    middleware и представление) по очереди в одном потоке на процесс.
+    Здесь цепочка middleware и представление целиком выполняются в пуле
+    потоков, а соединения клиентов обслуживает цикл событий.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.load_middleware(is_async=False)
+
+    async def get_response_async(self, request):
+        return await run_in_pool(self.get_response, request)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        # Потоковое содержимое читает базу, например курсором
+        # iterator(), а соединения привязаны к потоку. Поэтому все
+        # куски читаются в одном отдельном потоке и отправляются
+        # по мере готовности, без сборки ответа в памяти.
+        stream = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='asgi-stream'
+        )
+        try:
+            parts = iter(response)
+            read = sync_to_async(
+                next_part, thread_sensitive=False, executor=stream
+            )
+            while (part := await read(parts)) is not None:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            await send({'type': 'http.response.body'})
+        finally:
+            await sync_to_async(
+                close_stream, thread_sensitive=False, executor=stream
+            )(response)
+            stream.shutdown(wait=False)
@@ -0,0 +1,54 @@
+"""
+Метрики Prometheus. При заданной переменной PROMETHEUS_MULTIPROC_DIR
+prometheus_client пишет значения в файлы этого каталога, и /api/metrics
+суммирует их по всем воркерам gunicorn.
+"""
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry,
+                               Counter, Histogram, generate_latest,
+                               multiprocess)
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'HTTP-запросы по представлению, действию, методу и статусу.',
+    ['view', 'action', 'method', 'status'],
+)
+REQUEST_DURATION = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки HTTP-запроса.',
+    ['view', 'action'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Число запросов к базе за HTTP-запрос.',
+    ['view', 'action'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшам: result=hit или miss.',
+    ['cache', 'result'],
+)
+IMAGE_UPLOAD_BYTES = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных фотографий рецептов после декодирования base64.',
+    buckets=(
+        16 * 1024, 64 * 1024, 256 * 1024, 1024 ** 2, 2 * 1024 ** 2,
+        5 * 1024 ** 2, 10 * 1024 ** 2,
+    ),
+)
+
+
+def cache_result(cache, hit):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def exposition():
+    """Текст метрик и его Content-Type."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
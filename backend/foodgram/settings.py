@@ -31,6 +31,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,6 +41,27 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Профилирование запросов: Server-Timing, лог api.profiling
+# и гистограммы на /api/profiling/.
+REQUEST_PROFILING = bool(strtobool(os.getenv('REQUEST_PROFILING', 'False')))
+if REQUEST_PROFILING:
+    MIDDLEWARE.insert(0, 'api.middleware.RequestProfilingMiddleware')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -67,7 +89,25 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 0)),
+    }
+}
+# Общая база SQLite в памяти блокирует таблицы без ожидания, и тесты
+# с параллельными запросами падают. Тестовая база SQLite - файл.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
+# Версии справочников, версии учётных данных пользователей и тела
+# рецептов хранятся в кэше. Под несколькими процессами он должен быть
+# общим (memcached в infra/docker-compose.yml), иначе изменения из другого
+# процесса видны только через CATALOG_TTL и AUTH_TOKEN_CACHE_TTL.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
@@ -109,7 +149,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
@@ -136,3 +176,56 @@ DJOSER = {
 
 ZERO_MIN_VALUE = 0
 RECIPES_LIMIT = 3
+RECIPES_PAGE_SIZE = 6
+RECIPES_MAX_PAGE_SIZE = 100
+RECIPE_CACHE_TIMEOUT = 60 * 60
+CATALOG_TTL = 60
+INGREDIENTS_LIMIT = 100
+MATCH_MAX_INGREDIENTS = 100
+BATCH_MAX_RECIPES = 100
+AUTH_TOKEN_CACHE_SIZE = 10000
+# Сколько секунд удалённый токен может ещё работать в других процессах,
+# если кэш не общий.
+AUTH_TOKEN_CACHE_TTL = 30
+
+# Шрифт с кириллицей для выгрузки списка покупок в PDF.
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+# Сколько пар (пользователь, ингредиент) менять одним запросом при
+# пересчёте сумм в списках покупок.
+SHOPPING_CART_BATCH_SIZE = 500
+
+RECIPE_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+RECIPE_IMAGE_MAX_SIDE = 6000
+RECIPE_THUMBNAIL_SIZES = {
+    'small': 320,
+    'medium': 640,
+    'large': 1280,
+}
+RECIPE_THUMBNAIL_WORKERS = int(os.getenv('RECIPE_THUMBNAIL_WORKERS', 2))
+
+# Токен для /api/metrics: Prometheus передаёт его в заголовке
+# Authorization: Bearer <токен>. Без токена метрики не отдаются,
+# а nginx этот путь наружу не проксирует.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Потоков на процесс под ASGI, столько же соединений с базой.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+
+# Рейтинги рецептов: вес добавления в избранное и в список покупок,
+# вес самой публикации и период полураспада для сортировки trending.
+RECIPE_SCORE_FAVORITE_WEIGHT = 1.0
+RECIPE_SCORE_SHOPPING_CART_WEIGHT = 2.0
+RECIPE_SCORE_PUBLICATION_WEIGHT = 1.0
+RECIPE_SCORE_HALF_LIFE_HOURS = 48
+
+# Лента подписок: новые рецепты авторов, у которых подписчиков не больше
+# FEED_FANOUT_MAX_FOLLOWERS, раскладываются по лентам пачками при
+# публикации; рецепты более популярных авторов читаются при запросе ленты.
+# Когда автор снова опускается до порога, его последние
+# FEED_BACKFILL_LIMIT рецептов раскладываются по лентам заново.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 5000))
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_LIMIT = 50
@@ -0,0 +1,27 @@
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+bind = '0.0.0.0:8000'
+
+# SERVER_MODE=asgi: uvicorn-воркеры. Представления остаются синхронными
+# и выполняются в пуле потоков (foodgram.handlers.PooledASGIHandler).
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def on_starting(server):
+    """Файлы метрик прошлого запуска не должны попасть в суммы."""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(worker.pid)
@@ -38,7 +38,7 @@ class IngredientInRecipesAmountInline(admin.TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Админ панель управления рецептами."""
-    list_display = ('name', 'author', 'get_in_favorites')
+    list_display = ('name', 'author', 'get_in_favorites', 'in_carts_count')
     list_filter = (
         'name',
         'author',
@@ -48,7 +48,7 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
     def get_in_favorites(self, obj):
-        return obj.favorite_recipes.count()
+        return obj.favorites_count
 
 
 @admin.register(FavoriteReceipe)
@@ -0,0 +1,114 @@
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram import metrics
+
+from .models import Ingredient, Tag
+
+
+class Catalog:
+    """
+    Справочник, целиком загруженный в память процесса.
+
+    Номер версии хранится в кэше Django: при общем для процессов кэше
+    сброс версии в одном процессе приводит к перезагрузке справочника
+    во всех остальных. Кроме того, справочник перечитывается не реже
+    раза в CATALOG_TTL секунд; если данные изменились, а версия нет
+    (кэш у каждого процесса свой), версия сбрасывается. Объекты из
+    справочника общие для всех запросов, изменять их нельзя.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.version_key = f'catalog:{model._meta.label_lower}:version'
+        self._lock = threading.Lock()
+        self._version = None
+        self._expires = 0
+        self._signature = None
+        self._items = {}
+        self._derived = {}
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def invalidate(self):
+        cache.set(self.version_key, uuid.uuid4().hex, timeout=None)
+
+    def _is_fresh(self, version):
+        return version == self._version and time.monotonic() < self._expires
+
+    def _snapshot(self):
+        version = self.get_version()
+        fresh = self._is_fresh(version)
+        metrics.cache_result(f'catalog_{self.model._meta.model_name}', fresh)
+        if not fresh:
+            with self._lock:
+                if not self._is_fresh(version):
+                    self._load(version)
+        return self._version, self._items, self._derived
+
+    def _load(self, version):
+        items = self.model.objects.order_by('pk').in_bulk()
+        fields = self.model._meta.concrete_fields
+        signature = hash(tuple(
+            tuple(getattr(item, field.attname) for field in fields)
+            for item in items.values()
+        ))
+        if version == self._version and signature != self._signature:
+            # Справочник изменили в другом процессе, а версия в кэше
+            # этого процесса осталась прежней.
+            self.invalidate()
+            version = self.get_version()
+        self._items, self._derived = items, {}
+        self._signature = signature
+        self._version = version
+        self._expires = time.monotonic() + settings.CATALOG_TTL
+
+    @property
+    def version(self):
+        return self._snapshot()[0]
+
+    def etag(self):
+        return f'"{self.model._meta.model_name}-{self.version}"'
+
+    def all(self):
+        return list(self._snapshot()[1].values())
+
+    def get(self, pk):
+        return self._snapshot()[1].get(pk)
+
+    def in_bulk(self, pks):
+        """
+        Объекты по списку ключей для записи. Наличие ключей проверяется
+        одним запросом к базе: справочник может отставать от неё
+        на CATALOG_TTL. Ключи, которых нет в справочнике, дочитываются
+        из базы.
+        """
+        existing = set(self.model.objects.filter(
+            pk__in=set(pks)
+        ).values_list('pk', flat=True))
+        items = self._snapshot()[1]
+        found = {pk: items[pk] for pk in existing if pk in items}
+        missing = existing - found.keys()
+        if missing:
+            found.update(self.model.objects.in_bulk(missing))
+        return found
+
+    def derived(self, name, factory):
+        """Значение, вычисляемое один раз на версию справочника."""
+        version, items, derived = self._snapshot()
+        if name not in derived:
+            derived[name] = factory(list(items.values()))
+        return derived[name]
+
+
+tags = Catalog(Tag)
+ingredients = Catalog(Ingredient)
@@ -0,0 +1,74 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow, User
+from . import feed
+from .models import (FavoriteReceipe, IngredientInRecipesAmount, Recipe,
+                     ShoppingCart)
+
+# Строки какой модели считаются -> (модель со счётчиком, поле, связь).
+# bulk_create не отправляет сигналы, поэтому код, который создаёт
+# строки пачками, сам выставляет счётчик (ingredients_count и другие).
+COUNTERS = {
+    FavoriteReceipe: (Recipe, 'favorites_count', 'recipe'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe'),
+    IngredientInRecipesAmount: (Recipe, 'ingredients_count', 'recipe'),
+    Recipe: (User, 'recipes_count', 'author'),
+    Follow: (User, 'followers_count', 'author'),
+}
+
+
+def shift_counter(queryset, field, delta):
+    """Сдвигает счётчик одним UPDATE ... SET field = field + delta."""
+    if delta > 0:
+        queryset.update(**{field: F(field) + delta})
+    elif delta < 0:
+        queryset.update(**{field: Greatest(F(field) + delta, Value(0))})
+
+
+def rows_changed(rows_model, related_ids, sign):
+    """
+    Учитывает добавленные (sign=1) или удалённые (sign=-1) строки.
+    related_ids - ключи объектов со счётчиком, по одному на строку.
+    """
+    model, field, _ = COUNTERS[rows_model]
+    by_delta = defaultdict(list)
+    for pk, rows in Counter(related_ids).items():
+        by_delta[rows * sign].append(pk)
+    for delta, pks in by_delta.items():
+        shift_counter(model.objects.filter(pk__in=pks), field, delta)
+        if rows_model is Follow and delta < 0:
+            feed.fan_out_returned(pks, delta)
+
+
+def actual_count(rows_model, relation):
+    return Coalesce(
+        Subquery(
+            rows_model.objects.filter(
+                **{relation: OuterRef('pk')}
+            ).order_by().values(relation).annotate(
+                rows=Count('pk')
+            ).values('rows')
+        ),
+        0,
+    )
+
+
+def reconcile_counters(check=False):
+    """
+    Сверяет счётчики с реальным числом строк и исправляет расхождения.
+    Возвращает число расходящихся объектов по каждому счётчику.
+    """
+    drift = {}
+    for rows_model, (model, field, relation) in COUNTERS.items():
+        actual = actual_count(rows_model, relation)
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}
+        )
+        label = f'{model._meta.model_name}.{field}'
+        drift[label] = drifted.count() if check else drifted.update(
+            **{field: actual}
+        )
+    return drift
@@ -0,0 +1,152 @@
+from functools import partial
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from users.models import Follow, User
+from .models import FeedItem, Recipe
+
+
+def fans_out(author):
+    """Раскладываются ли рецепты автора по лентам при публикации."""
+    return author.followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора пачками."""
+    if fans_out(recipe.author):
+        fan_out_many([(recipe.pk, recipe.author_id, recipe.pub_date)])
+
+
+def fan_out_many(recipes):
+    """
+    Раскладывает пачку рецептов (pk, author_id, pub_date) по лентам
+    подписчиков. Авторы, которых читают при запросе ленты, пропускаются.
+    """
+    by_author = {}
+    for pk, author_id, pub_date in recipes:
+        by_author.setdefault(author_id, []).append((pk, pub_date))
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    follows = Follow.objects.filter(
+        author_id__in=by_author,
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).order_by().values_list('user_id', 'author_id')
+    batch = []
+    for user_id, author_id in follows.iterator(chunk_size=batch_size):
+        batch.extend(
+            FeedItem(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in by_author[author_id]
+        )
+        if len(batch) >= batch_size:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(follow):
+    """Добавляет в ленту нового подписчика последние рецепты автора."""
+    recipes = Recipe.objects.filter(
+        author_id=follow.author_id
+    ).order_by('-pub_date', '-id').values_list('pk', 'pub_date')
+    FeedItem.objects.bulk_create(
+        [
+            FeedItem(user_id=follow.user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in recipes[:settings.FEED_BACKFILL_LIMIT]
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove(follow):
+    """Убирает рецепты автора из ленты отписавшегося пользователя."""
+    FeedItem.objects.filter(
+        user_id=follow.user_id, recipe__author_id=follow.author_id
+    ).delete()
+
+
+def fan_out_returned(author_ids, delta):
+    """
+    Снова раскладывает последние рецепты авторов, у которых после
+    отписок (delta < 0) подписчиков стало не больше
+    FEED_FANOUT_MAX_FOLLOWERS. Пока их читали при запросе ленты, новые
+    рецепты по лентам не раскладывались и иначе пропали бы из них.
+    """
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    returned = list(User.objects.filter(
+        pk__in=author_ids,
+        followers_count__lte=limit,
+        followers_count__gt=limit + delta,
+    ).values_list('pk', flat=True))
+    for author_id in returned:
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', 'author_id', 'pub_date')
+        transaction.on_commit(partial(
+            fan_out_many, recipes[:settings.FEED_BACKFILL_LIMIT]
+        ))
+
+
+class FeedSources:
+    """
+    Лента из нескольких упорядоченных источников. Курсорная пагинация
+    сортирует, фильтрует и режет каждый источник отдельно, так что
+    каждый читается по своему индексу с лимитом страницы, а страница
+    склеивается из их начал.
+    """
+
+    def __init__(self, *sources, ordering=()):
+        self.sources = sources
+        self.ordering = ordering
+
+    def order_by(self, *ordering):
+        return FeedSources(
+            *(source.order_by(*ordering) for source in self.sources),
+            ordering=ordering,
+        )
+
+    def filter(self, *args, **kwargs):
+        return FeedSources(
+            *(source.filter(*args, **kwargs) for source in self.sources),
+            ordering=self.ordering,
+        )
+
+    def __getitem__(self, page):
+        recipes = [
+            recipe
+            for source in self.sources
+            for recipe in source[:page.stop]
+        ]
+        recipes.sort(
+            key=attrgetter(*(field.lstrip('-') for field in self.ordering)),
+            reverse=self.ordering[0].startswith('-'),
+        )
+        return recipes[page]
+
+
+def feed_queryset(queryset, user):
+    """
+    Рецепты из ленты пользователя с полями feed_pub_date и feed_recipe
+    для сортировки.
+    Рецепты авторов без раскладки читаются отдельным источником.
+    """
+    unfanned_ids = list(Follow.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('author_id', flat=True))
+    # Чтение идёт по индексу (user, pub_date, recipe) таблицы ленты.
+    fanned = queryset.filter(feed_items__user=user).annotate(
+        feed_pub_date=F('feed_items__pub_date'),
+        feed_recipe=F('feed_items__recipe'),
+    )
+    if not unfanned_ids:
+        return fanned
+    # Записи ленты, оставшиеся с тех пор, как автор раскладывался,
+    # не должны повторять рецепты, прочитанные напрямую.
+    return FeedSources(
+        fanned.exclude(author_id__in=unfanned_ids),
+        queryset.filter(author_id__in=unfanned_ids).annotate(
+            feed_pub_date=F('pub_date'), feed_recipe=F('pk')
+        ),
+    )
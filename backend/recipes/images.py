@@ -0,0 +1,74 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True},
+}
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails',
+)
+
+
+def thumbnail_name(image_name, size_name, extension):
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'recipes/thumbnails/{stem}_{size_name}.{extension}'
+
+
+def render_thumbnails(image):
+    """Уменьшенные копии изображения во всех размерах и форматах."""
+    image = image.convert('RGB')
+    for size_name, side in settings.RECIPE_THUMBNAIL_SIZES.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((side, side), Image.LANCZOS)
+        for extension, options in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            thumbnail.save(buffer, **options)
+            yield size_name, extension, buffer.getvalue()
+
+
+def make_thumbnails(recipe_id, image_name):
+    """Строит превью и записывает их пути в рецепт."""
+    close_old_connections()
+    try:
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        with storage.open(image_name) as file, Image.open(file) as image:
+            thumbnails = {}
+            for size_name, extension, content in render_thumbnails(image):
+                name = thumbnail_name(image_name, size_name, extension)
+                if storage.exists(name):
+                    storage.delete(name)
+                thumbnails.setdefault(size_name, {})[extension] = (
+                    storage.save(name, ContentFile(content))
+                )
+        # Картинку могли заменить, пока строились превью.
+        Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+            thumbnails=thumbnails, updated=timezone.now()
+        )
+    except Exception:
+        logger.exception('Не удалось построить превью для %s', image_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnails(recipe):
+    """Ставит построение превью в пул после фиксации транзакции."""
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(make_thumbnails, recipe_id, image_name)
+    )
@@ -0,0 +1,85 @@
+import json
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from recipes.models import IngredientInRecipesAmount, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты в NDJSON: по строке на рецепт с автором, '
+        'тегами, ингредиентами и путём к фотографии.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def batches(self, batch_size):
+        """Рецепты пачками по возрастанию pk, без OFFSET."""
+        last_pk = 0
+        while True:
+            recipes = list(Recipe.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values(
+                'pk', 'name', 'text', 'cooking_time', 'image', 'pub_date',
+                'author__email',
+            )[:batch_size])
+            if not recipes:
+                return
+            last_pk = recipes[-1]['pk']
+            yield recipes
+
+    def lines(self, batch_size):
+        for recipes in self.batches(batch_size):
+            pks = [recipe['pk'] for recipe in recipes]
+            tags = defaultdict(list)
+            for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=pks
+            ).values_list('recipe_id', 'tag__slug'):
+                tags[recipe_id].append(slug)
+            ingredients = defaultdict(list)
+            for recipe_id, name, unit, amount in (
+                IngredientInRecipesAmount.objects.filter(
+                    recipe_id__in=pks
+                ).values_list(
+                    'recipe_id', 'ingredient__name',
+                    'ingredient__measurement_unit', 'amount',
+                )
+            ):
+                ingredients[recipe_id].append({
+                    'name': name, 'measurement_unit': unit, 'amount': amount,
+                })
+            for recipe in recipes:
+                yield json.dumps({
+                    'name': recipe['name'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'image': recipe['image'],
+                    'pub_date': recipe['pub_date'].isoformat(),
+                    'author': recipe['author__email'],
+                    'tags': tags[recipe['pk']],
+                    'ingredients': ingredients[recipe['pk']],
+                }, ensure_ascii=False) + '\n'
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            file = sys.stdout
+        else:
+            file = open(options['path'], 'w', encoding='utf-8')
+        exported = 0
+        try:
+            for line in self.lines(options['batch_size']):
+                file.write(line)
+                exported += 1
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}'
+        ))
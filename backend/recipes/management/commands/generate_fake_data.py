@@ -0,0 +1,230 @@
+import itertools
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from recipes import feed, search
+from recipes.counters import reconcile_counters
+from recipes.models import (FavoriteReceipe, Ingredient,
+                            IngredientInRecipesAmount, Recipe, ShoppingCart,
+                            ShoppingCartIngredient, Tag)
+from recipes.scores import update_scores
+from users.models import Follow, User
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def zipf_weights(size):
+    """Накопленные веса: первые элементы популярнее остальных."""
+    return list(itertools.accumulate(1 / (rank + 1) for rank in range(size)))
+
+
+def sample(rng, population, cum_weights, k):
+    """k разных элементов с учётом весов."""
+    k = min(k, len(population))
+    chosen = set()
+    while len(chosen) < k:
+        chosen.update(rng.choices(
+            population, cum_weights=cum_weights, k=k - len(chosen)
+        ))
+    return chosen
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетических пользователей, подписки, рецепты, '
+        'избранное и списки покупок для нагрузочных замеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument(
+            '--follows', type=int, default=10,
+            help='Подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Рецептов в избранном у пользователя.',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Рецептов в списке покупок у пользователя.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--prefix', default='fake',
+            help='Префикс имён и почты создаваемых пользователей.',
+        )
+
+    def ensure_catalogs(self):
+        if not Ingredient.objects.exists():
+            call_command('load_ingredient_csv', stdout=self.stdout)
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create(
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            )
+
+    def create_users(self, options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}-').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix'
+            )
+        password = make_password(prefix)
+        User.objects.bulk_create(
+            [
+                User(
+                    email=f'{prefix}-{number}@example.com',
+                    username=f'{prefix}-{number}',
+                    first_name='Имя',
+                    last_name=f'Фамилия {number}',
+                    password=password,
+                )
+                for number in range(options['users'])
+            ],
+            batch_size=options['batch_size'],
+        )
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}-'
+        ).order_by('pk').values_list('pk', flat=True))
+
+    def create_follows(self, rng, user_ids, options):
+        cum_weights = zipf_weights(len(user_ids))
+        Follow.objects.bulk_create(
+            [
+                Follow(user_id=user_id, author_id=author_id)
+                for user_id in user_ids
+                for author_id in sample(
+                    rng, user_ids, cum_weights, options['follows'] + 1
+                )
+                if author_id != user_id
+            ],
+            batch_size=options['batch_size'],
+        )
+
+    def create_recipes(self, rng, user_ids, options):
+        batch_size = options['batch_size']
+        author_weights = zipf_weights(len(user_ids))
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        ingredient_weights = zipf_weights(len(ingredient_ids))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        now = timezone.now()
+        plans = []
+        for number in range(options['recipes']):
+            plans.append((
+                rng.choices(user_ids, cum_weights=author_weights)[0],
+                now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                sample(rng, tag_ids, None, rng.randint(1, 2)),
+                sample(
+                    rng, ingredient_ids, ingredient_weights,
+                    rng.randint(3, 12),
+                ),
+            ))
+        Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author_id=author_id,
+                    name=f'Рецепт {number}',
+                    text='Описание рецепта ' * 20,
+                    cooking_time=rng.randint(5, 180),
+                    image='recipes/fake.png',
+                    ingredients_count=len(ingredients),
+                )
+                for number, (author_id, _, _, ingredients) in enumerate(plans)
+            ],
+            batch_size=batch_size,
+        )
+        # Рецепты новых авторов вставлены по порядку pk.
+        recipe_ids = list(Recipe.objects.filter(
+            author_id__in=user_ids
+        ).order_by('pk').values_list('pk', flat=True))
+        # auto_now_add перезаписывает pub_date при вставке.
+        Recipe.objects.bulk_update(
+            [
+                Recipe(pk=pk, pub_date=pub_date)
+                for pk, (_, pub_date, _, _) in zip(recipe_ids, plans)
+            ],
+            ['pub_date'],
+            batch_size=batch_size,
+        )
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=pk, tag_id=tag_id)
+                for pk, (_, _, tags, _) in zip(recipe_ids, plans)
+                for tag_id in tags
+            ],
+            batch_size=batch_size,
+        )
+        IngredientInRecipesAmount.objects.bulk_create(
+            [
+                IngredientInRecipesAmount(
+                    recipe_id=pk, ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500),
+                )
+                for pk, (_, _, _, ingredients) in zip(recipe_ids, plans)
+                for ingredient_id in ingredients
+            ],
+            batch_size=batch_size,
+        )
+        return recipe_ids
+
+    def create_user_lists(self, rng, user_ids, recipe_ids, options):
+        cum_weights = zipf_weights(len(recipe_ids))
+        shuffled = recipe_ids[:]
+        rng.shuffle(shuffled)
+        for model, per_user in (
+            (FavoriteReceipe, options['favorites']),
+            (ShoppingCart, options['carts']),
+        ):
+            model.objects.bulk_create(
+                [
+                    model(user_id=user_id, recipe_id=recipe_id)
+                    for user_id in user_ids
+                    for recipe_id in sample(
+                        rng, shuffled, cum_weights, per_user
+                    )
+                ],
+                batch_size=options['batch_size'],
+            )
+
+    def refresh_derived(self, recipe_ids, batch_size):
+        """Пересчитывает то, что при bulk_create не обновляют сигналы."""
+        reconcile_counters()
+        ShoppingCartIngredient.objects.rebuild()
+        update_scores(full=True)
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            search.update_index(batch)
+            feed.fan_out_many(Recipe.objects.filter(
+                pk__in=batch
+            ).values_list('pk', 'author_id', 'pub_date'))
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = time.perf_counter()
+        self.ensure_catalogs()
+        with transaction.atomic():
+            user_ids = self.create_users(options)
+            self.create_follows(rng, user_ids, options)
+            recipe_ids = self.create_recipes(rng, user_ids, options)
+            self.create_user_lists(rng, user_ids, recipe_ids, options)
+            self.refresh_derived(recipe_ids, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)} '
+            f'за {time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import executor, make_thumbnails
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит превью фотографий для рецептов, у которых их нет.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Перестроить превью у всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(thumbnails={})
+        jobs = [
+            executor.submit(make_thumbnails, recipe_id, image_name)
+            for recipe_id, image_name in recipes.values_list(
+                'pk', 'image'
+            ).iterator()
+        ]
+        for job in jobs:
+            job.result()
+        self.stdout.write(
+            self.style.SUCCESS(f'Превью построены для рецептов: {len(jobs)}')
+        )
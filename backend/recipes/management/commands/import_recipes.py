@@ -0,0 +1,189 @@
+import json
+import sys
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from recipes import catalog, counters, feed, scores, search
+from recipes.models import IngredientInRecipesAmount, Recipe, RecipeScore
+from users.models import User
+
+AUTHOR_CACHE_SIZE = 10000
+
+
+def tags_by_slug(tags):
+    return {tag.slug: tag.pk for tag in tags}
+
+
+def ingredients_by_key(ingredients):
+    return {
+        (ingredient.name, ingredient.measurement_unit): ingredient.pk
+        for ingredient in ingredients
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из NDJSON, выгруженного export_recipes. '
+        'Авторы, теги и ингредиенты должны уже существовать.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл с рецептами, по умолчанию stdin.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def resolve_authors(self, emails):
+        """Ключи авторов по email; кэш ограничен по размеру."""
+        emails = set(emails)
+        missing = emails - self.authors.keys()
+        if len(self.authors) + len(missing) > AUTHOR_CACHE_SIZE:
+            self.authors = {}
+            missing = emails
+        if missing:
+            self.authors.update(User.objects.filter(
+                email__in=missing
+            ).values_list('email', 'pk'))
+
+    def parse(self, item):
+        """Рецепт и его связи или причина пропуска."""
+        author_id = self.authors.get(item['author'])
+        if author_id is None:
+            return 'нет автора'
+        tag_ids = [self.tags.get(slug) for slug in item['tags']]
+        if None in tag_ids:
+            return 'нет тега'
+        amounts = {}
+        for ingredient in item['ingredients']:
+            ingredient_id = self.ingredients.get(
+                (ingredient['name'], ingredient['measurement_unit'])
+            )
+            if ingredient_id is None:
+                return 'нет ингредиента'
+            amounts[ingredient_id] = int(ingredient['amount'])
+        pub_date = parse_datetime(item.get('pub_date') or '')
+        recipe = Recipe(
+            author_id=author_id,
+            name=item['name'],
+            text=item['text'],
+            cooking_time=int(item['cooking_time']),
+            image=item['image'],
+            ingredients_count=len(amounts),
+        )
+        return recipe, pub_date or timezone.now(), set(tag_ids), amounts
+
+    def save_recipes(self, recipes):
+        """
+        bulk_create с получением pk. Если база не возвращает pk
+        из вставки (SQLite в Django 3.2), ключи выдаются по порядку
+        от текущего максимума внутри транзакции.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            start = (
+                Recipe.objects.aggregate(last=Max('pk'))['last'] or 0
+            ) + 1
+            for offset, recipe in enumerate(recipes):
+                recipe.pk = start + offset
+        Recipe.objects.bulk_create(recipes)
+
+    @transaction.atomic
+    def import_batch(self, items):
+        self.resolve_authors(
+            item.get('author') for item in items if item.get('author')
+        )
+        parsed = []
+        for item in items:
+            try:
+                result = self.parse(item)
+            except (KeyError, TypeError, ValueError):
+                result = 'ошибка в данных'
+            if isinstance(result, str):
+                self.skipped[result] += 1
+            else:
+                parsed.append(result)
+        if not parsed:
+            return 0
+        recipes = [recipe for recipe, _, _, _ in parsed]
+        self.save_recipes(recipes)
+        # auto_now_add перезаписывает pub_date при вставке.
+        for recipe, pub_date, _, _ in parsed:
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, _, tag_ids, _ in parsed
+            for tag_id in tag_ids
+        ])
+        IngredientInRecipesAmount.objects.bulk_create([
+            IngredientInRecipesAmount(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe, _, _, amounts in parsed
+            for ingredient_id, amount in amounts.items()
+        ])
+        # Сигналы при bulk_create не отправляются, поэтому
+        # денормализованные данные обновляются здесь.
+        counters.rows_changed(
+            Recipe, [recipe.author_id for recipe in recipes], 1
+        )
+        RecipeScore.objects.bulk_create(
+            [scores.initial_score(recipe) for recipe in recipes]
+        )
+        search.update_index([recipe.pk for recipe in recipes])
+        feed.fan_out_many(
+            (recipe.pk, recipe.author_id, recipe.pub_date)
+            for recipe in recipes
+        )
+        return len(recipes)
+
+    def batches(self, file, batch_size):
+        batch = []
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                batch.append(json.loads(line))
+            except ValueError:
+                raise CommandError(f'Строка {number}: некорректный JSON')
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def handle(self, *args, **options):
+        self.tags = catalog.tags.derived('by_slug', tags_by_slug)
+        self.ingredients = catalog.ingredients.derived(
+            'by_name_and_unit', ingredients_by_key
+        )
+        self.authors = {}
+        self.skipped = Counter()
+        if options['path'] == '-':
+            file = sys.stdin
+        else:
+            try:
+                file = open(options['path'], encoding='utf-8')
+            except FileNotFoundError:
+                raise CommandError(f'Файл {options["path"]} не найден')
+        imported = 0
+        try:
+            for batch in self.batches(file, options['batch_size']):
+                imported += self.import_batch(batch)
+        finally:
+            if file is not sys.stdin:
+                file.close()
+        for reason, count in self.skipped.items():
+            self.stdout.write(
+                self.style.WARNING(f'Пропущено ({reason}): {count}')
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}. Превью фотографий строит '
+            f'generate_thumbnails.'
+        ))
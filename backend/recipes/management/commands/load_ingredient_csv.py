@@ -1,36 +1,153 @@
 import csv
+import io
+import json
+import os
+import time
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes import catalog
 from recipes.models import Ingredient
 
+DEFAULT_FILE = 'recipes/data/ingredients.csv'
+FORMATS = ('csv', 'json', 'ndjson')
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield name, measurement_unit
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item['name'], item['measurement_unit']
+
+
+def read_json(file):
+    """Читает массив объектов по частям, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position = file.read(READ_SIZE).lstrip(), 1
+    if not buffer.startswith('['):
+        raise CommandError('Ожидался JSON-массив объектов')
+    while True:
+        while True:
+            # Пропускаем пробелы и запятые между элементами.
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item['name'], item['measurement_unit']
+            position = end
+        chunk = file.read(READ_SIZE)
+        if not chunk:
+            raise CommandError('JSON-массив оборван')
+        buffer, position = buffer[position:] + chunk, 0
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'ndjson': read_ndjson}
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты из CSV, JSON или NDJSON. Повторы '
+        '(название, единица измерения) пропускаются.'
+    )
 
-    def handle(self, *args, **options):
-        try:
-            file_name = 'recipes/data/ingredients.csv'
-            with open(file_name, 'r', encoding='utf-8') as file:
-                print(file)
-                file_reader = csv.reader(file, delimiter=',')
-                upload_list = []
-                for row in file_reader:
-                    name, measurement_unit = row
-                    new = Ingredient(
-                        name=name,
-                        measurement_unit=measurement_unit
-                    )
-                    if new not in upload_list:
-                        upload_list.append(new)
-                Ingredient.objects.bulk_create(upload_list)
-                self.stdout.write(
-                    self.style.SUCCESS('Ингредиенты успешно загружены')
-                )
-
-        except FileNotFoundError:
-            self.stdout.write(
-                self.style.ERROR('Ошибка')
-            )
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', default=[DEFAULT_FILE])
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файлов; по умолчанию по расширению.',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def get_format(self, path, file_format):
+        file_format = file_format or os.path.splitext(path)[1][1:].lower()
+        if file_format not in FORMATS:
             raise CommandError(
-                'В директории recipes/data нет файла'
+                f'Неизвестный формат файла {path}, укажите --format'
+            )
+        return file_format
+
+    def unique_rows(self, paths, file_format):
+        seen = set()
+        for path in paths:
+            reader = READERS[self.get_format(path, file_format)]
+            try:
+                with open(path, encoding='utf-8', newline='') as file:
+                    for name, measurement_unit in reader(file):
+                        key = (name.strip(), measurement_unit.strip())
+                        if key[0] and key not in seen:
+                            seen.add(key)
+                            yield key
+            except FileNotFoundError:
+                raise CommandError(f'Файл {path} не найден')
+            except (KeyError, ValueError) as error:
+                raise CommandError(f'Ошибка в файле {path}: {error!r}')
+
+    def insert(self, batch):
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in batch
+            ],
+            ignore_conflicts=True,
+        )
+
+    def copy(self, batch):
+        """COPY во временную таблицу и вставка с пропуском повторов."""
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS ingredient_load '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_load FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_load '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
             )
+            cursor.execute('TRUNCATE ingredient_load')
+
+    def handle(self, *args, **options):
+        write = (
+            self.copy if connection.vendor == 'postgresql' else self.insert
+        )
+        batch_size = options['batch_size']
+        start = time.perf_counter()
+        before = Ingredient.objects.count()
+        read = 0
+        with transaction.atomic():
+            batch = []
+            for row in self.unique_rows(options['paths'], options['format']):
+                batch.append(row)
+                read += 1
+                if len(batch) == batch_size:
+                    write(batch)
+                    batch = []
+            if batch:
+                write(batch)
+        catalog.ingredients.invalidate()
+        elapsed = time.perf_counter() - start
+        added = Ingredient.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингредиентов прочитано: {read}, добавлено: {added}, '
+            f'{read / elapsed if elapsed else 0:.0f} строк/с'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет суммы ингредиентов в списках покупок с живыми данными '
+        'и пересобирает таблицу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, без пересборки.',
+        )
+
+    def handle(self, *args, **options):
+        live = ShoppingCartIngredient.objects.live_totals()
+        stored = ShoppingCartIngredient.objects.stored_totals()
+        drift = {
+            key for key in {*live, *stored}
+            if live.get(key) != stored.get(key)
+        }
+        if options['check']:
+            if drift:
+                raise CommandError(
+                    f'Расхождений в списках покупок: {len(drift)}'
+                )
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок совпадают с данными')
+            )
+            return
+        ShoppingCartIngredient.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, исправлено строк: {len(drift)}'
+        ))
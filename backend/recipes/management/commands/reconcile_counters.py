@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Сверяет счётчики избранного, корзин, рецептов и подписчиков.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, без исправления.',
+        )
+
+    def handle(self, *args, **options):
+        drift = reconcile_counters(check=options['check'])
+        for label, rows in drift.items():
+            self.stdout.write(f'{label}: {rows}')
+        if options['check'] and any(drift.values()):
+            raise CommandError('Счётчики расходятся с данными')
+        self.stdout.write(self.style.SUCCESS('Счётчики сверены'))
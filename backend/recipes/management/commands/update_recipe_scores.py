@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from recipes.scores import update_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинги рецептов для сортировки popular '
+        'и trending. Запускается периодически, например из cron.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать все рецепты, а не только изменившиеся.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько рецептов пересчитывать за один запрос.',
+        )
+
+    def handle(self, *args, **options):
+        updated = update_scores(
+            full=options['full'], batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'Пересчитано рейтингов: {updated}')
+        )
@@ -0,0 +1,27 @@
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Cast, NullIf
+
+from .models import IngredientInRecipesAmount
+
+
+def match_recipes(ingredient_ids, limit):
+    """
+    Рецепты, в которых есть хотя бы один из ингредиентов, по убыванию
+    покрытия: доли ингредиентов рецепта, которые уже есть.
+    Строки берутся по индексу (ingredient, recipe) только для
+    переданных ингредиентов, без просмотра всей таблицы.
+    Возвращает список (recipe_id, matched, coverage).
+    Если счётчик ингредиентов рецепта ещё нулевой, покрытие NULL.
+    """
+    matches = IngredientInRecipesAmount.objects.filter(
+        ingredient_id__in=ingredient_ids
+    ).values('recipe').annotate(
+        matched=Count('pk'),
+    ).annotate(
+        coverage=Cast('matched', FloatField())
+        / NullIf(F('recipe__ingredients_count'), 0),
+    ).order_by(F('coverage').desc(nulls_last=True), '-matched', '-recipe')
+    return [
+        (row['recipe'], row['matched'], row['coverage'])
+        for row in matches[:limit]
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 06:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_cart_ingredients(apps, schema_editor):
+    IngredientInRecipesAmount = apps.get_model(
+        'recipes', 'IngredientInRecipesAmount'
+    )
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient'
+    )
+    totals = IngredientInRecipesAmount.objects.filter(
+        recipe__shopping_recipes__isnull=False
+    ).values_list(
+        'recipe__shopping_recipes__user', 'ingredient'
+    ).annotate(amount_sum=models.Sum('amount')).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        [
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=ingredient_id, amount=amount
+            )
+            for user_id, ingredient_id, amount in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(help_text='Суммарное количество ингредиента в списке покупок', verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_totals', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_cart_ingredient'),
+        ),
+        migrations.RunPython(
+            fill_shopping_cart_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 06:30
+
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)',
+)
+POSTGRES_BACKWARD = (
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix',
+)
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Индексы под автодополнение ингредиентов на PostgreSQL.
+    Django строит istartswith/icontains как UPPER(name::text) LIKE ...,
+    поэтому индексы построены по тому же выражению.
+    """
+
+    dependencies = [
+        ('recipes', '0003_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgres(POSTGRES_FORWARD),
+            run_on_postgres(POSTGRES_BACKWARD),
+        ),
+    ]
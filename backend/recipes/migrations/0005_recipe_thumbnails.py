@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Пути к уменьшенным копиям по размерам и форматам', verbose_name='Превью фотографии'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 06:21
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'FavoriteReceipe',
+     'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count', 'recipes', 'ShoppingCart',
+     'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Follow', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, rows_app, rows_model, relation in COUNTERS:
+        rows = apps.get_model(rows_app, rows_model).objects.filter(
+            **{relation: OuterRef('pk')}
+        ).order_by().values(relation).annotate(
+            rows=Count('pk')
+        ).values('rows')
+        apps.get_model(app, model).objects.update(
+            **{field: Coalesce(Subquery(rows), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_pub_date_id_index'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
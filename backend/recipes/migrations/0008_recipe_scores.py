@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 07:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favoritereceipe',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now, verbose_name='Добавлено'),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(default=0, help_text='Взвешенное число добавлений в избранное и корзины', verbose_name='Популярность')),
+                ('trending', models.FloatField(default=0, help_text='Логарифм суммы добавлений с затуханием по времени', verbose_name='Актуальность')),
+                ('favorites_count', models.PositiveIntegerField(default=0)),
+                ('in_carts_count', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField(null=True, verbose_name='Пересчитан')),
+            ],
+            options={
+                'verbose_name': 'Рейтинг рецепта',
+                'verbose_name_plural': 'Рейтинги рецептов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['computed_at'], name='recipe_score_computed_idx'),
+        ),
+    ]
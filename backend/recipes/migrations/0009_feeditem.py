@@ -0,0 +1,52 @@
+# Generated by Django 3.2 on 2026-10-18 06:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feed(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    for user_id, author_id in Follow.objects.values_list('user', 'author'):
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('pk', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+        FeedItem.objects.bulk_create([
+            FeedItem(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in recipes
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_items', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_item_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 3.2 on 2026-10-18 06:40
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+import recipes.models
+
+POSTGRES_FORWARD = (
+    "UPDATE recipes_recipe r SET search_vector = "
+    "setweight(to_tsvector('russian', r.name), 'A') "
+    "|| setweight(to_tsvector('russian', COALESCE(("
+    "SELECT string_agg(i.name, ' ') "
+    "FROM recipes_ingredientinrecipesamount a "
+    "JOIN recipes_ingredient i ON i.id = a.ingredient_id "
+    "WHERE a.recipe_id = r.id), '')), 'B') "
+    "|| setweight(to_tsvector('russian', r.text), 'C')",
+)
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts USING fts5('
+    "name, text, ingredients, tokenize = 'unicode61 remove_diacritics 2')",
+    'INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients) '
+    'SELECT r.id, r.name, r.text, '
+    "COALESCE(GROUP_CONCAT(i.name, ' '), '') "
+    'FROM recipes_recipe r '
+    'LEFT JOIN recipes_ingredientinrecipesamount a ON a.recipe_id = r.id '
+    'LEFT JOIN recipes_ingredient i ON i.id = a.ingredient_id '
+    'GROUP BY r.id',
+)
+SQLITE_BACKWARD = (
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+
+def run_on(vendor, statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != vendor:
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Полнотекстовый поиск рецептов: GIN-индекс по search_vector
+    на PostgreSQL, таблица FTS5 на SQLite.
+    """
+
+    dependencies = [
+        ('recipes', '0009_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=recipes.models.PostgresGinIndex(fields=['search_vector'], name='recipes_recipe_search_vector'),
+        ),
+        migrations.RunPython(
+            run_on('postgresql', POSTGRES_FORWARD),
+            migrations.RunPython.noop,
+        ),
+        migrations.RunPython(
+            run_on('sqlite', SQLITE_FORWARD),
+            run_on('sqlite', SQLITE_BACKWARD),
+        ),
+    ]
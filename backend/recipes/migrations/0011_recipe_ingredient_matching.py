@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 06:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    rows = apps.get_model(
+        'recipes', 'IngredientInRecipesAmount'
+    ).objects.filter(recipe=OuterRef('pk')).order_by().values(
+        'recipe'
+    ).annotate(rows=Count('pk')).values('rows')
+    apps.get_model('recipes', 'Recipe').objects.update(
+        ingredients_count=Coalesce(Subquery(rows), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество ингредиентов'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredientinrecipesamount',
+            index=models.Index(fields=['ingredient', 'recipe'], name='ingredient_recipe_idx'),
+        ),
+        migrations.RunPython(
+            fill_ingredients_count, migrations.RunPython.noop
+        ),
+    ]
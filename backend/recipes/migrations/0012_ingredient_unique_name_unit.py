@@ -0,0 +1,64 @@
+# Generated by Django 3.2 on 2026-10-18 06:32
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+# Строки, ссылающиеся на ингредиент -> поле владельца строки.
+REFERENCES = (
+    ('IngredientInRecipesAmount', 'recipe_id'),
+    ('ShoppingCartIngredient', 'user_id'),
+)
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Сводит повторяющиеся ингредиенты к одному: ссылки переносятся
+    на ингредиент с наименьшим id, количества складываются.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=Min('pk'), rows=Count('pk')
+    ).filter(rows__gt=1)
+    touched_recipes = set()
+    for group in groups:
+        extra = list(Ingredient.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit']
+        ).exclude(pk=group['keep']).values_list('pk', flat=True))
+        for model_name, owner in REFERENCES:
+            model = apps.get_model('recipes', model_name)
+            for row in model.objects.filter(ingredient_id__in=extra):
+                kept, created = model.objects.get_or_create(
+                    **{owner: getattr(row, owner)},
+                    ingredient_id=group['keep'],
+                    defaults={'amount': row.amount},
+                )
+                if not created:
+                    kept.amount += row.amount
+                    kept.save(update_fields=['amount'])
+                    if owner == 'recipe_id':
+                        touched_recipes.add(row.recipe_id)
+                row.delete()
+        Ingredient.objects.filter(pk__in=extra).delete()
+    through = apps.get_model('recipes', 'IngredientInRecipesAmount')
+    for recipe_id in touched_recipes:
+        Recipe.objects.filter(pk=recipe_id).update(
+            ingredients_count=through.objects.filter(
+                recipe_id=recipe_id
+            ).count()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_ingredient_matching'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
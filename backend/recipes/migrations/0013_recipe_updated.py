@@ -0,0 +1,20 @@
+# Generated by Django 3.2 on 2026-10-18 06:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_ingredient_unique_name_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Меняется при любом изменении, видимом в API', verbose_name='Изменён'),
+            preserve_default=False,
+        ),
+    ]
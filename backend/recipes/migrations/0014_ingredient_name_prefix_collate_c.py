@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 07:40
+
+from django.db import migrations
+
+POSTGRES_FORWARD = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix_c '
+    'ON recipes_ingredient ((UPPER(name::text) COLLATE "C"))',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix',
+)
+POSTGRES_BACKWARD = (
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix_c',
+)
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+    """
+    Индекс для совпадений по началу названия в порядке C: по нему
+    идут и условие LIKE 'X%', и сортировка, так что автодополнение
+    читает из индекса только первые limit строк. Индекс
+    text_pattern_ops из 0004 сортировку не покрывал и не использовался.
+    """
+
+    dependencies = [
+        ('recipes', '0013_recipe_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgres(POSTGRES_FORWARD),
+            run_on_postgres(POSTGRES_BACKWARD),
+        ),
+    ]
@@ -1,6 +1,11 @@
-from django.db import models
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models, transaction
+from django.db.backends.ddl_references import Statement
+from django.db.models.functions import Greatest
 
-from users.models import User
+from users.models import CountersMixin, Follow, User
 
 
 class Tag(models.Model):
@@ -49,12 +54,83 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit',
+            )
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """Запросы для чтения рецептов без лишних обращений к базе."""
+
+    def with_user_flags(self, user):
+        """Аннотирует признаки избранного и списка покупок."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(FavoriteReceipe.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+        )
+
+    def for_read(self, user):
+        """Подгружает теги, ингредиенты и авторов с подпиской."""
+        if user.is_authenticated:
+            is_subscribed = models.Exists(Follow.objects.filter(
+                user=user, author=models.OuterRef('pk')
+            ))
+        else:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField()
+            )
+        return self.prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe',
+                queryset=IngredientInRecipesAmount.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+            models.Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed),
+            ),
+        ).defer('search_vector').with_user_flags(user)
+
+
+class PostgresGinIndex(GinIndex):
+    """
+    GIN-индекс, который создаётся только на PostgreSQL. На SQLite
+    поиск идёт по таблице FTS5, а USING gin там не поддерживается.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('')
+        return super().create_sql(model, schema_editor, using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('')
+        return super().remove_sql(model, schema_editor, **kwargs)
+
+
+class Recipe(CountersMixin, models.Model):
     """Модель для рецептов."""
 
     tags = models.ManyToManyField(
@@ -83,6 +159,13 @@ class Recipe(models.Model):
         'Фотография блюда',
         upload_to='recipes/',
     )
+    thumbnails = models.JSONField(
+        'Превью фотографии',
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text='Пути к уменьшенным копиям по размерам и форматам',
+    )
     text = models.TextField(
         'Описание рецепта'
     )
@@ -91,11 +174,44 @@ class Recipe(models.Model):
         help_text='Время приготовления блюда',
     )
     pub_date = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(
+        'Изменён',
+        auto_now=True,
+        help_text='Меняется при любом изменении, видимом в API',
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        default=0,
+        editable=False,
+    )
+    ingredients_count = models.PositiveIntegerField(
+        'Количество ингредиентов',
+        default=0,
+        editable=False,
+    )
+    # Заполняется только на PostgreSQL, см. recipes.search.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count', 'ingredients_count')
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            PostgresGinIndex(
+                fields=['search_vector'], name='recipes_recipe_search_vector'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -134,6 +250,12 @@ class IngredientInRecipesAmount(models.Model):
                 name='unique_ingredient',
             )
         ]
+        indexes = [
+            # Обратный индекс: рецепты по ингредиенту, см. recipes.matching.
+            models.Index(
+                fields=['ingredient', 'recipe'], name='ingredient_recipe_idx'
+            ),
+        ]
 
 
 class FavoriteReceipe(models.Model):
@@ -152,6 +274,9 @@ class FavoriteReceipe(models.Model):
         related_name='favorite_recipes',
         verbose_name='Рецепты',
     )
+    created = models.DateTimeField(
+        'Добавлено', auto_now_add=True, db_index=True
+    )
 
     class Meta:
         verbose_name = 'Избранное'
@@ -180,6 +305,9 @@ class ShoppingCart(models.Model):
         related_name='shopping_recipes',
         verbose_name='Рецепты',
     )
+    created = models.DateTimeField(
+        'Добавлено', auto_now_add=True, db_index=True
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -190,3 +318,281 @@ class ShoppingCart(models.Model):
                 name='recipe_in_shopping_cart',
             )
         ]
+
+
+class RecipeScore(models.Model):
+    """
+    Рейтинг рецепта для сортировки ленты.
+    Пересчитывается командой update_recipe_scores.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+    popular = models.FloatField(
+        'Популярность',
+        default=0,
+        help_text='Взвешенное число добавлений в избранное и корзины',
+    )
+    trending = models.FloatField(
+        'Актуальность',
+        default=0,
+        help_text='Логарифм суммы добавлений с затуханием по времени',
+    )
+    favorites_count = models.PositiveIntegerField(default=0)
+    in_carts_count = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField('Пересчитан', null=True)
+
+    class Meta:
+        verbose_name = 'Рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+        indexes = [
+            models.Index(
+                fields=['-popular', '-recipe'], name='recipe_score_popular_idx'
+            ),
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_score_trending_idx',
+            ),
+            models.Index(
+                fields=['computed_at'], name='recipe_score_computed_idx'
+            ),
+        ]
+
+
+class FeedItem(models.Model):
+    """
+    Рецепт в ленте подписчика. Записи создаются при публикации
+    рецепта, дата публикации копируется для чтения ленты по индексу.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx',
+            ),
+        ]
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+    """Поддержка суммарных количеств ингредиентов в списках покупок."""
+
+    def apply_deltas(self, deltas, batch_size=None):
+        """
+        Применяет изменения вида {(user_id, ingredient_id): delta}.
+        Прибавки вносятся INSERT ... ON CONFLICT DO UPDATE, так что
+        параллельные добавления новой пары не упираются в уникальность.
+        Убавки - UPDATE, строки с нулевым количеством удаляются.
+        Пары обрабатываются пачками по batch_size в порядке ключей,
+        чтобы запросы оставались ограниченными, а блокировки строк
+        брались в одном порядке.
+        """
+        batch_size = batch_size or settings.SHOPPING_CART_BATCH_SIZE
+        added = sorted(
+            (key, delta) for key, delta in deltas.items() if delta > 0
+        )
+        removed = sorted(
+            (key, delta) for key, delta in deltas.items() if delta < 0
+        )
+        if not added and not removed:
+            return
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(added), batch_size):
+                self.upsert_amounts(added[start:start + batch_size])
+            for start in range(0, len(removed), batch_size):
+                self.subtract_amounts(removed[start:start + batch_size])
+
+    def upsert_amounts(self, added):
+        """Прибавляет пачку [((user_id, ingredient_id), delta)]."""
+        opts = self.model._meta
+        quote = connections[self.db].ops.quote_name
+        table = quote(opts.db_table)
+        user, ingredient, amount = (
+            quote(opts.get_field(name).column)
+            for name in ('user', 'ingredient', 'amount')
+        )
+        values = ', '.join(['(%s, %s, %s)'] * len(added))
+        params = [
+            value
+            for (user_id, ingredient_id), delta in added
+            for value in (user_id, ingredient_id, delta)
+        ]
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {ingredient}, {amount}) '
+                f'VALUES {values} '
+                f'ON CONFLICT ({user}, {ingredient}) DO UPDATE '
+                f'SET {amount} = {table}.{amount} + EXCLUDED.{amount}',
+                params,
+            )
+
+    def subtract_amounts(self, removed):
+        """Убавляет пачку [((user_id, ingredient_id), delta)]."""
+        pairs = models.Q()
+        cases = []
+        for (user_id, ingredient_id), delta in removed:
+            pair = models.Q(user_id=user_id, ingredient_id=ingredient_id)
+            pairs |= pair
+            cases.append(models.When(pair, then=models.Value(delta)))
+        self.filter(pairs).update(amount=Greatest(
+            models.F('amount') + models.Case(
+                *cases, output_field=models.IntegerField()
+            ),
+            models.Value(0),
+        ))
+        self.filter(pairs, amount=0).delete()
+
+    def add_recipes(self, user_id, recipe_ids, sign=1):
+        """Учитывает рецепты в списке покупок (sign=-1 - убранные)."""
+        deltas = {}
+        amounts = IngredientInRecipesAmount.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('ingredient_id', 'amount')
+        for ingredient_id, amount in amounts:
+            key = (user_id, ingredient_id)
+            deltas[key] = deltas.get(key, 0) + sign * amount
+        self.apply_deltas(deltas)
+
+    def remove_recipes(self, user_id, recipe_ids):
+        self.add_recipes(user_id, recipe_ids, sign=-1)
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """
+        Переносит изменение ингредиентов рецепта в списки покупок
+        всех пользователей, у которых он лежит в корзине.
+        Количества передаются как {ingredient_id: amount}.
+        """
+        diff = {}
+        for ingredient_id in {*old_amounts, *new_amounts}:
+            delta = (
+                new_amounts.get(ingredient_id, 0)
+                - old_amounts.get(ingredient_id, 0)
+            )
+            if delta:
+                diff[ingredient_id] = delta
+        if not diff:
+            return
+        user_ids = ShoppingCart.objects.filter(
+            recipe=recipe
+        ).order_by('user_id').values_list('user_id', flat=True)
+        # Пользователей берём пачками, чтобы не собирать в памяти
+        # изменения для всех корзин с рецептом сразу.
+        users_per_batch = max(
+            settings.SHOPPING_CART_BATCH_SIZE // len(diff), 1
+        )
+        with transaction.atomic(using=self.db):
+            batch = []
+            for user_id in user_ids.iterator(chunk_size=users_per_batch):
+                batch.append(user_id)
+                if len(batch) == users_per_batch:
+                    self.apply_deltas(self.user_deltas(batch, diff))
+                    batch = []
+            self.apply_deltas(self.user_deltas(batch, diff))
+
+    @staticmethod
+    def user_deltas(user_ids, diff):
+        return {
+            (user_id, ingredient_id): delta
+            for user_id in user_ids
+            for ingredient_id, delta in diff.items()
+        }
+
+    def live_totals(self):
+        """Считает суммы заново по рецептам в списках покупок."""
+        totals = IngredientInRecipesAmount.objects.filter(
+            recipe__shopping_recipes__isnull=False
+        ).values_list(
+            'recipe__shopping_recipes__user', 'ingredient'
+        ).annotate(amount_sum=models.Sum('amount')).order_by()
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in totals.iterator()
+        }
+
+    def stored_totals(self):
+        return {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in self.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            ).iterator()
+        }
+
+    def rebuild(self, batch_size=1000):
+        """Полностью пересобирает таблицу по живым данным."""
+        with transaction.atomic(using=self.db):
+            self.all().delete()
+            self.bulk_create(
+                [
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for (user_id, ingredient_id), amount
+                    in self.live_totals().items()
+                ],
+                batch_size=batch_size,
+            )
+
+
+class ShoppingCartIngredient(models.Model):
+    """
+    Суммарное количество ингредиента в списке покупок пользователя.
+    Обновляется при изменении корзины и ингредиентов рецептов.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_totals',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        help_text='Суммарное количество ингредиента в списке покупок',
+    )
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_cart_ingredient',
+            )
+        ]
@@ -0,0 +1,122 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import F, Max, Q
+from django.utils import timezone
+
+from .models import FavoriteReceipe, Recipe, RecipeScore, ShoppingCart
+
+# Время отсчитывается от фиксированной точки: актуальность хранится
+# в логарифмической шкале, и старые оценки не нужно пересчитывать
+# только из-за того, что прошло время.
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def decay_term(moment, weight):
+    """Логарифм вклада события с весом weight в момент moment."""
+    half_life = settings.RECIPE_SCORE_HALF_LIFE_HOURS * 3600
+    age = (moment - EPOCH).total_seconds()
+    return math.log(weight) + age * math.log(2) / half_life
+
+
+def log_sum_exp(terms):
+    top = max(terms)
+    return top + math.log(sum(math.exp(term - top) for term in terms))
+
+
+def popular_score(favorites_count, in_carts_count):
+    return (
+        favorites_count * settings.RECIPE_SCORE_FAVORITE_WEIGHT
+        + in_carts_count * settings.RECIPE_SCORE_SHOPPING_CART_WEIGHT
+    )
+
+
+def initial_score(recipe):
+    """Оценка нового рецепта: активности ещё нет, есть публикация."""
+    return RecipeScore(
+        recipe=recipe,
+        trending=decay_term(
+            recipe.pub_date, settings.RECIPE_SCORE_PUBLICATION_WEIGHT
+        ),
+    )
+
+
+def stale_recipe_ids(since):
+    """
+    Рецепты, оценки которых устарели: изменились счётчики
+    или появились добавления после прошлого пересчёта.
+    """
+    ids = set(Recipe.objects.filter(
+        Q(score__isnull=True)
+        | Q(score__computed_at__isnull=True)
+        | ~Q(favorites_count=F('score__favorites_count'))
+        | ~Q(in_carts_count=F('score__in_carts_count'))
+    ).values_list('pk', flat=True))
+    for model in (FavoriteReceipe, ShoppingCart):
+        ids.update(model.objects.filter(
+            created__gte=since
+        ).values_list('recipe_id', flat=True))
+    return ids
+
+
+def compute_scores(recipe_ids, computed_at):
+    weights = {
+        FavoriteReceipe: settings.RECIPE_SCORE_FAVORITE_WEIGHT,
+        ShoppingCart: settings.RECIPE_SCORE_SHOPPING_CART_WEIGHT,
+    }
+    terms = defaultdict(list)
+    for model, weight in weights.items():
+        for recipe_id, created in model.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'created').iterator():
+            terms[recipe_id].append(decay_term(created, weight))
+    recipes = Recipe.objects.filter(pk__in=recipe_ids).values_list(
+        'pk', 'pub_date', 'favorites_count', 'in_carts_count'
+    )
+    for pk, pub_date, favorites_count, in_carts_count in recipes:
+        terms[pk].append(
+            decay_term(pub_date, settings.RECIPE_SCORE_PUBLICATION_WEIGHT)
+        )
+        yield RecipeScore(
+            recipe_id=pk,
+            popular=popular_score(favorites_count, in_carts_count),
+            trending=log_sum_exp(terms[pk]),
+            favorites_count=favorites_count,
+            in_carts_count=in_carts_count,
+            computed_at=computed_at,
+        )
+
+
+def update_scores(full=False, batch_size=500):
+    """
+    Пересчитывает оценки рецептов, у которых была активность
+    с прошлого запуска, или все оценки при full=True.
+    Возвращает число пересчитанных рецептов.
+    """
+    # Момент запуска берётся до чтения данных: добавления, сделанные
+    # во время пересчёта, попадут в следующий запуск.
+    computed_at = timezone.now()
+    since = RecipeScore.objects.aggregate(since=Max('computed_at'))['since']
+    if full or since is None:
+        recipe_ids = set(Recipe.objects.values_list('pk', flat=True))
+    else:
+        recipe_ids = stale_recipe_ids(since)
+    existing = set(RecipeScore.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    recipe_ids = sorted(recipe_ids)
+    for start in range(0, len(recipe_ids), batch_size):
+        scores = list(compute_scores(
+            recipe_ids[start:start + batch_size], computed_at
+        ))
+        RecipeScore.objects.bulk_create(
+            [score for score in scores if score.pk not in existing]
+        )
+        RecipeScore.objects.bulk_update(
+            [score for score in scores if score.pk in existing],
+            ['popular', 'trending', 'favorites_count', 'in_carts_count',
+             'computed_at'],
+        )
+    return len(recipe_ids)
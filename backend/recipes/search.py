@@ -0,0 +1,131 @@
+import re
+from threading import local
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+
+from .models import IngredientInRecipesAmount, Recipe
+
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# Веса колонок FTS5 для bm25: название, описание, ингредиенты.
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+
+# Рецепты, которые ждут пересчёта индекса после фиксации транзакции.
+_pending = local()
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    """Вектор по названию, ингредиентам и описанию рецепта."""
+    ingredient_names = IngredientInRecipesAmount.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(Subquery(ingredient_names), Value('')),
+            weight='B',
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_index(recipe_ids):
+    """Пересчитывает поисковый индекс для рецептов."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    if is_postgres():
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            search_vector=search_vector()
+        )
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids,
+        )
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients) '
+            'SELECT r.id, r.name, r.text, '
+            "COALESCE(GROUP_CONCAT(i.name, ' '), '') "
+            'FROM recipes_recipe r '
+            'LEFT JOIN recipes_ingredientinrecipesamount a '
+            'ON a.recipe_id = r.id '
+            'LEFT JOIN recipes_ingredient i ON i.id = a.ingredient_id '
+            f'WHERE r.id IN ({placeholders}) GROUP BY r.id',
+            recipe_ids,
+        )
+
+
+def schedule_update(recipe_ids):
+    """
+    Пересчитывает индекс после фиксации транзакции, когда ингредиенты
+    рецепта, добавленные через bulk_create, уже сохранены. Первый
+    обработчик забирает все накопленные рецепты, остальные ничего
+    не делают, так что каждый рецепт пересчитывается один раз.
+    """
+    _pending.__dict__.setdefault('recipe_ids', set()).update(recipe_ids)
+    transaction.on_commit(update_pending)
+
+
+def update_pending():
+    update_index(_pending.__dict__.pop('recipe_ids', ()))
+
+
+def remove_from_index(recipe_ids):
+    recipe_ids = list(recipe_ids)
+    if is_postgres() or not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            recipe_ids,
+        )
+
+
+def fts_query(text):
+    """
+    Запрос FTS5 из слов пользователя: все слова обязательны
+    и ищутся по началу, что отчасти заменяет стемминг.
+    """
+    words = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search(queryset, text):
+    """Рецепты, подходящие под запрос, с релевантностью search_rank."""
+    if is_postgres():
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    match = fts_query(text)
+    if not match:
+        return queryset.none()
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match],
+    )).annotate(search_rank=RawSQL(
+        f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s '
+        f'AND rowid = {Recipe._meta.db_table}.id',
+        [match],
+    )).order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,113 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Follow, User
+from . import catalog, counters, feed, scores, search
+from .models import (Ingredient, IngredientInRecipesAmount, Recipe,
+                     ShoppingCart, ShoppingCartIngredient, Tag)
+
+
+# Поля пользователя, которые показываются в рецептах.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    catalog.tags.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    catalog.ingredients.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def reindex_ingredient_recipes(instance, created, **kwargs):
+    if not created:
+        search.schedule_update(
+            instance.recipe_set.values_list('pk', flat=True)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_recipe(instance, **kwargs):
+    search.schedule_update([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=IngredientInRecipesAmount)
+def reindex_recipe_ingredients(instance, **kwargs):
+    search.schedule_update([instance.recipe_id])
+
+
+@receiver(post_delete, sender=Recipe)
+def remove_from_search(instance, **kwargs):
+    search.remove_from_index([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def create_score(instance, created, **kwargs):
+    if created:
+        scores.initial_score(instance).save(force_insert=True)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        feed.backfill(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(instance, **kwargs):
+    feed.remove(instance)
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(instance, created, update_fields, **kwargs):
+    """Данные автора входят в кэшированные ответы по его рецептам."""
+    if created or (
+        update_fields and not AUTHOR_FIELDS.intersection(update_fields)
+    ):
+        return
+    Recipe.objects.filter(author=instance).update(updated=timezone.now())
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_totals(instance, created, **kwargs):
+    if created:
+        ShoppingCartIngredient.objects.add_recipes(
+            instance.user_id, [instance.recipe_id]
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_shopping_totals(instance, **kwargs):
+    """
+    Сработает и при каскадном удалении рецепта или пользователя:
+    pre_delete приходит до удаления ингредиентов рецепта.
+    """
+    ShoppingCartIngredient.objects.remove_recipes(
+        instance.user_id, [instance.recipe_id]
+    )
+
+
+def count_created(sender, instance, created, **kwargs):
+    if created:
+        _, _, relation = counters.COUNTERS[sender]
+        counters.rows_changed(sender, [getattr(instance, relation + '_id')], 1)
+
+
+def count_deleted(sender, instance, **kwargs):
+    _, _, relation = counters.COUNTERS[sender]
+    counters.rows_changed(sender, [getattr(instance, relation + '_id')], -1)
+
+
+for rows_model in counters.COUNTERS:
+    post_save.connect(count_created, sender=rows_model)
+    post_delete.connect(count_deleted, sender=rows_model)
@@ -0,0 +1,119 @@
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import Follow
+from . import counters, feed
+from .models import ShoppingCart, ShoppingCartIngredient
+
+
+def link_columns(model):
+    """
+    Таблица связи и её колонки: пользователь, объект, поля
+    auto_now_add, которые при сыром INSERT заполняются вручную.
+    """
+    target_model, _, relation = counters.COUNTERS[model]
+    opts = model._meta
+    stamped = [
+        field for field in opts.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    return (
+        target_model,
+        opts.get_field('user').column,
+        opts.get_field(relation).column,
+        stamped,
+    )
+
+
+def insert_links(model, user_id, target_ids):
+    """
+    Одним INSERT ... ON CONFLICT DO NOTHING RETURNING добавляет связи
+    пользователя с объектами. Несуществующие объекты и уже добавленные
+    связи пропускаются. Возвращает [(pk связи, ключ объекта)].
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return []
+    target_model, user_column, target_column, stamped = link_columns(model)
+    quote = connection.ops.quote_name
+    now = timezone.now()
+    columns = [user_column, target_column, *(
+        field.column for field in stamped
+    )]
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    stamps = ''.join(', %s' for _ in stamped)
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(column) for column in columns)}) '
+        f'SELECT %s, {quote(target_model._meta.pk.column)}{stamps} '
+        f'FROM {quote(target_model._meta.db_table)} '
+        f'WHERE {quote(target_model._meta.pk.column)} IN ({placeholders}) '
+        f'ON CONFLICT DO NOTHING '
+        f'RETURNING {quote(model._meta.pk.column)}, {quote(target_column)}'
+    )
+    params = [
+        user_id,
+        *(field.get_db_prep_value(now, connection) for field in stamped),
+        *target_ids,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def delete_links(model, user_id, target_ids):
+    """
+    Одним DELETE ... RETURNING убирает связи пользователя с объектами.
+    Возвращает [(pk связи, ключ объекта)] действительно удалённых.
+    """
+    target_ids = list(target_ids)
+    if not target_ids:
+        return []
+    _, user_column, target_column, _ = link_columns(model)
+    quote = connection.ops.quote_name
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    sql = (
+        f'DELETE FROM {quote(model._meta.db_table)} '
+        f'WHERE {quote(user_column)} = %s '
+        f'AND {quote(target_column)} IN ({placeholders}) '
+        f'RETURNING {quote(model._meta.pk.column)}, {quote(target_column)}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *target_ids])
+        return cursor.fetchall()
+
+
+def after_change(model, user, rows, sign):
+    """
+    Сырой SQL не отправляет сигналы: счётчики, списки покупок и ленты
+    обновляются здесь же.
+    """
+    target_ids = [target_id for _, target_id in rows]
+    counters.rows_changed(model, target_ids, sign)
+    if model is ShoppingCart:
+        ShoppingCartIngredient.objects.add_recipes(
+            user.pk, target_ids, sign
+        )
+    elif model is Follow:
+        for pk, author_id in rows:
+            follow = Follow(pk=pk, user_id=user.pk, author_id=author_id)
+            if sign > 0:
+                feed.backfill(follow)
+            else:
+                feed.remove(follow)
+
+
+@transaction.atomic
+def add(model, user, target_ids):
+    """Добавляет связи и возвращает ключи объектов, что добавились."""
+    rows = insert_links(model, user.pk, target_ids)
+    after_change(model, user, rows, 1)
+    return [target_id for _, target_id in rows]
+
+
+@transaction.atomic
+def remove(model, user, target_ids):
+    """Убирает связи и возвращает ключи объектов, что были связаны."""
+    rows = delete_links(model, user.pk, target_ids)
+    after_change(model, user, rows, -1)
+    return [target_id for _, target_id in rows]
@@ -7,7 +7,10 @@ from .models import Follow, User
 class UserAdmin(admin.ModelAdmin):
     """Отображение и фильтр полей User в админке."""
 
-    list_display = ('id', 'username', 'first_name', 'last_name', 'email', )
+    list_display = (
+        'id', 'username', 'first_name', 'last_name', 'email',
+        'recipes_count', 'followers_count',
+    )
     search_fields = ('username', 'email', )
     list_filter = ('first_name', 'email', )
     list_display_links = ('username', )
@@ -2,7 +2,31 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 
 
-class User(AbstractUser):
+class CountersMixin:
+    """
+    Счётчики в counter_fields меняются только запросами
+    UPDATE ... SET поле = поле + n (recipes.counters). Обычный save()
+    существующего объекта их не записывает: значение в памяти могло
+    устареть и затёрло бы изменения из других запросов.
+    """
+
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (
+            update_fields is None and not force_insert
+            and not self._state.adding
+        ):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(force_insert, force_update, using, update_fields)
+
+
+class User(CountersMixin, AbstractUser):
     """Кастомная модель пользователя."""
 
     email = models.EmailField(
@@ -35,9 +59,20 @@ class User(AbstractUser):
         blank=False,
         null=False
     )
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('username', 'first_name', 'last_name',)
+    counter_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         verbose_name = 'Пользователь'